@@ -0,0 +1,241 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+# ASGI entry point serving the same app and ApiRoutes:
+#
+#   uvicorn asgi:application --workers 4
+#
+# get_channels and get_keys, which the frontend polls, run on the
+# event loop with SQLAlchemy's asyncio engine and redis.asyncio.
+# They share queries, validation, limits and the user cache with
+# the Flask handlers. Every other route, and requests flask-login
+# has to handle itself (no user in the session cookie), is served
+# by the Flask app in asgiref's thread pool.
+# Compare with the gevent deployment by scripts/bench_asgi.py.
+
+import asyncio
+from http import HTTPStatus
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, Tuple
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask, Response
+from itsdangerous import BadSignature
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from werkzeug.http import parse_cookie
+
+import metrics
+import my_limits
+from content_limits import AsyncCombinedLimiter, LimitsConfig, \
+    LocalLimiter, LimitTypes, Limits, Storages, format_limit_key
+from core import add_header, create_app
+from handlers import ApiRoutes, AbortResponse, RequestMethods
+from handlers.channel import get_json_channels
+from handlers.errors import ChannelNotExistError, \
+    TooManyRequestsError, Error
+from handlers.grant import get_channel_keys
+from redis_storage.redis_session import base_init as redis_base_init, \
+    async_base_init as async_redis_base_init
+from redis_storage.user_cache import AsyncUserCache, CachedUser
+from storage.db_session import base_init, get_async_engine
+from storage.user import User
+from storage.user_type_cache import UserTypeCache
+
+# Status and JSON body of a route
+Reply = Tuple[int, object]
+Route = Callable[[AsyncSession, CachedUser, dict], Awaitable[Reply]]
+
+
+def abort_json(error: Error) -> AbortResponse:
+    return AbortResponse(ok=False, code=error.code,
+                         description=error.description)
+
+
+async def get_channels(session: AsyncSession, user: CachedUser,
+                       args: dict) -> Reply:
+    return HTTPStatus.OK, await session.run_sync(
+        lambda sync_session: get_json_channels(user, sync_session))
+
+
+async def get_keys(session: AsyncSession, user: CachedUser,
+                   args: dict) -> Reply:
+    channel_id = args.get('channel_id', [''])[0]
+    if not channel_id:
+        return HTTPStatus.UNPROCESSABLE_ENTITY, \
+            abort_json(ChannelNotExistError())
+
+    keys_json, error = await session.run_sync(
+        lambda sync_session: get_channel_keys(sync_session, channel_id,
+                                              user))
+    if error:
+        return HTTPStatus.FORBIDDEN, abort_json(error)
+    return HTTPStatus.OK, keys_json
+
+
+# Routes served on the event loop and their limits
+ROUTES: Dict[str, Tuple[Route, str]] = {
+    ApiRoutes.GetChannels: (get_channels, Limits.GetChannels),
+    ApiRoutes.GetKeys: (get_keys, Limits.GetKeys),
+}
+
+
+def get_remote_address(scope: dict) -> str:
+    """ Same as Flask's request.remote_addr behind WsgiToAsgi """
+    return scope['client'][0] if scope.get('client') else '127.0.0.1'
+
+
+def get_cookies(scope: dict) -> dict:
+    header = b'; '.join(value for name, value in scope['headers']
+                        if name == b'cookie')
+    return parse_cookie(header.decode('latin-1'))
+
+
+class PanelApplication:
+    """
+    ASGI app serving ROUTES itself and the rest by the Flask app.
+    """
+
+    def __init__(self, app: Flask, engine: AsyncEngine, rds: Redis,
+                 limiter: AsyncCombinedLimiter, config: LimitsConfig,
+                 user_types: UserTypeCache,
+                 local_limiter_size: int = my_limits.LOCAL_LIMITER_SIZE):
+        self.app = app
+        self.wsgi = WsgiToAsgi(app)
+        self.engine = engine
+        self.session_maker = sessionmaker(bind=engine,
+                                          class_=AsyncSession)
+        self.rds = rds
+        self.user_cache = AsyncUserCache(rds)
+        self.limiter = limiter
+        self.local_limiter = LocalLimiter(local_limiter_size)
+        self.config = config
+        self.user_types = user_types
+
+        # None without a secret key, then Flask serves everything
+        self.serializer = app.session_interface \
+            .get_signing_serializer(app)
+        # Flask endpoints, so limit keys are the same as Flask's
+        urls = app.url_map.bind('')
+        self.endpoints = {path: urls.match(path, RequestMethods.GET)[0]
+                          for path in ROUTES}
+
+    async def __call__(self, scope: dict, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http' and self.serializer and \
+                scope['method'] == RequestMethods.GET and \
+                scope['path'] in ROUTES:
+            user_id = self.get_user_id(scope)
+            user = user_id and await self.user_cache.get(
+                user_id, self.load_user)
+            if user:
+                return await self.serve(scope, send, user)
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await self.rds.connection_pool.disconnect()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def get_user_id(self, scope: dict) -> str or None:
+        """
+        User id flask-login keeps in the session cookie. Sessions
+        it would change in this request are left to Flask.
+        """
+
+        interface = self.app.session_interface
+        cookie = get_cookies(scope).get(
+            interface.get_cookie_name(self.app))
+        if not cookie:
+            return
+        max_age = int(self.app.permanent_session_lifetime
+                      .total_seconds())
+        try:
+            session = self.serializer.loads(cookie, max_age=max_age)
+        except BadSignature:
+            return
+        if '_remember' in session or session.get('_permanent'):
+            return
+        return session.get('_user_id')
+
+    async def load_user(self, user_id: str) -> User or None:
+        async with self.session_maker() as session:
+            return await session.get(User, user_id)
+
+    def get_tier(self, user: CachedUser) -> str or None:
+        user_type = self.user_types.get(user.user_type)
+        return user_type.name if user_type else None
+
+    async def hit(self, scope: dict, user: CachedUser) -> bool:
+        path = scope['path']
+        _, route = ROUTES[path]
+        endpoint = self.endpoints[path]
+        address = get_remote_address(scope)
+
+        limit = self.config.get(route, None)
+        if limit.storage == Storages.local:
+            return self.local_limiter.hit([format_limit_key(
+                LimitTypes.ip, Storages.local, address, endpoint,
+                RequestMethods.GET)], limit)
+
+        # Tiers are cached in memory, but a refresh queries the DB
+        tier = await asyncio.to_thread(self.get_tier, user)
+        limit = self.config.get(route, tier)
+        keys = [format_limit_key(LimitTypes.ip, limit.strategy, address,
+                                 endpoint, RequestMethods.GET),
+                format_limit_key(LimitTypes.user, limit.strategy,
+                                 user.id, endpoint, RequestMethods.GET)]
+        return await self.limiter.hit(keys, limit)
+
+    async def serve(self, scope: dict, send, user: CachedUser):
+        started = perf_counter()
+        path = scope['path']
+        route, _ = ROUTES[path]
+
+        if await self.hit(scope, user):
+            args = parse_qs(scope['query_string'].decode('latin-1'))
+            async with self.session_maker() as session:
+                status, body = await route(session, user, args)
+        else:
+            metrics.RATE_LIMITED.labels(path).inc()
+            status = HTTPStatus.TOO_MANY_REQUESTS
+            body = abort_json(TooManyRequestsError())
+
+        response: Response = add_header(self.app.json.response(body))
+        response.status_code = status
+        await send({'type': 'http.response.start',
+                    'status': response.status_code,
+                    'headers': [(name.lower().encode('latin-1'),
+                                 value.encode('latin-1'))
+                                for name, value in response.headers]})
+        await send({'type': 'http.response.body',
+                    'body': response.get_data()})
+
+        metrics.observe_request(path, RequestMethods.GET,
+                                response.status_code, started)
+
+
+def create_application(app: Flask = None) -> PanelApplication:
+    return PanelApplication(
+        app or create_app(), get_async_engine(), async_redis_base_init(),
+        my_limits.async_limiter(), my_limits.limits_config(),
+        UserTypeCache(base_init(), redis_base_init()))
+
+
+application = create_application()
@@ -5,41 +5,224 @@
 #  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
 #  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
 
-from flask import make_response, Flask
-from flask_limiter.extension import LimitDecorator
+import json
+from collections import OrderedDict
+from enum import Enum
+from functools import wraps
+from secrets import token_hex
+from threading import Lock
+from time import monotonic, time
+from typing import Callable, Union, Iterable, List, NamedTuple, Dict, \
+    Tuple
+
+from flask import make_response, request
 from flask_login import current_user, AnonymousUserMixin
+from redis import Redis
 
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
+import metrics
 from handlers import AbortResponse, errors
+from storage.user_type_cache import UserTypeCache
 
-from typing import Callable
+LimitDecorator = Callable[[Callable], Callable]
+Cost = Union[int, Callable[[], int]]
 
-from enum import Enum
+# Checks every limit first and counts the hit only if all allow it,
+# so a request refused by one limit doesn't eat the others.
+# KEYS: limit states. ARGV: cost, now (ms), then strategy,
+# count and window (ms) per key, and a random token of the call
+# that keeps moving window members of concurrent hits apart.
+# Returns {0, 0} or the refusing key's index and ms to wait.
+HIT_SCRIPT = """
+local cost = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local token = ARGV[#KEYS * 3 + 3]
+local states = {}
+
+for i, key in ipairs(KEYS) do
+    local strategy = ARGV[i * 3]
+    local count = tonumber(ARGV[i * 3 + 1])
+    local window = tonumber(ARGV[i * 3 + 2])
+    local wait = 0
+
+    if strategy == 'fixed-window' then
+        local current = tonumber(redis.call('GET', key) or '0')
+        if current + cost > count then
+            wait = redis.call('PTTL', key)
+            if wait < 1 then
+                wait = window
+            end
+        end
+    elseif strategy == 'moving-window' then
+        redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+        local current = redis.call('ZCARD', key)
+        if current + cost > count then
+            wait = window
+            local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+            if oldest[2] then
+                wait = tonumber(oldest[2]) + window - now
+            end
+        end
+    else
+        local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+        local tokens = count
+        if bucket[1] then
+            tokens = math.min(count, tonumber(bucket[1]) +
+                (now - tonumber(bucket[2])) * count / window)
+        end
+        states[i] = tokens
+        if tokens < cost then
+            wait = math.ceil((cost - tokens) * window / count)
+        end
+    end
+
+    if wait > 0 then
+        return {i, wait}
+    end
+end
+
+for i, key in ipairs(KEYS) do
+    local strategy = ARGV[i * 3]
+    local window = ARGV[i * 3 + 2]
+
+    if strategy == 'fixed-window' then
+        if redis.call('INCRBY', key, cost) == cost then
+            redis.call('PEXPIRE', key, window)
+        end
+    elseif strategy == 'moving-window' then
+        for j = 1, cost do
+            redis.call('ZADD', key, now, now .. ':' .. token .. ':' .. j)
+        end
+        redis.call('PEXPIRE', key, window)
+    else
+        redis.call('HSET', key, 'tokens', states[i] - cost,
+            'updated', now)
+        redis.call('PEXPIRE', key, window)
+    end
+end
+return {0, 0}
+"""
 
 
 class Limits:
     """
-    Rate limits on API methods: <count>/minute
+    Rate limited API methods, counts are set in the limits config
     """
 
-    ChannelCreate = 2
-    GetChannels = 60
-    ChannelRename = 3
-    KeyCreate = 10
-    GetKeys = 60
-    KeyToggle = 10
-    KeyDelete = 10
-    MixinCreate = 10
-    GetMixins = 60
-    MixinDelete = 10
-    GetUser = 60
-    Register = 20
-    Login = 20
-    UserRename = 3
-    ChangeEmail = 5
-    ChangePassword = 3
-    Logout = 1
+    ChannelCreate = 'ChannelCreate'
+    GetChannels = 'GetChannels'
+    ChannelRename = 'ChannelRename'
+    KeyCreate = 'KeyCreate'
+    KeyBatchCreate = 'KeyBatchCreate'  # each batch costs its size
+    GetKeys = 'GetKeys'
+    KeyToggle = 'KeyToggle'
+    KeyDelete = 'KeyDelete'
+    MixinCreate = 'MixinCreate'
+    GetMixins = 'GetMixins'
+    MixinDelete = 'MixinDelete'
+    GetUser = 'GetUser'
+    Register = 'Register'
+    Login = 'Login'
+    UserRename = 'UserRename'
+    ChangeEmail = 'ChangeEmail'
+    ChangePassword = 'ChangePassword'
+    Logout = 'Logout'
+    Index = 'Index'
+    Helpdesk = 'Helpdesk'
+    Service = 'Service'
+
+
+class Strategies:
+    fixed_window = 'fixed-window'
+    moving_window = 'moving-window'
+    token_bucket = 'token-bucket'
+
+    all = (fixed_window, moving_window, token_bucket)
+
+
+class Storages:
+    """
+    Where hits of a route are counted. Local routes are counted
+    per client address in each worker and never reach Redis,
+    for cheap pages where an approximate limit is enough.
+    """
+
+    redis = 'redis'
+    local = 'local'
+
+
+class LimitTypes(Enum):
+    ip = 'ip'
+    user = 'user'
+
+
+class RouteLimit(NamedTuple):
+    count: int
+    strategy: str
+    window: int  # seconds
+    storage: str
+
+
+class LimitsConfig:
+    """
+    Route limits from the limits config:
+
+    {"default": {"strategy": "fixed-window", "window": 60},
+     "routes": {"<route>": {"count": 10, ...}},
+     "tiers": {"<user type name>": {"multiplier": 5,
+                                    "routes": {"<route>": {...}}}}}
+
+    Route settings override defaults and tier route settings
+    override both. Anonymous users and tiers not in the config
+    get route settings as they are. Routes with "storage": "local"
+    use fixed windows and aren't changed by tiers.
+    """
+
+    def __init__(self, config: dict):
+        self.default = config.get('default', {})
+        self.routes = config.get('routes', {})
+        self.tiers = config.get('tiers', {})
+        self.resolved: Dict[Tuple[str, str], RouteLimit] = {}
+
+        for route in self.routes:
+            for tier in (None, *self.tiers):
+                self.resolve(route, tier)
+
+    def resolve(self, route: str, tier: str or None) -> RouteLimit:
+        tier_config = self.tiers.get(tier, {})
+        settings = {**self.default, **self.routes[route],
+                    **tier_config.get('routes', {}).get(route, {})}
+
+        if settings.get('strategy') not in Strategies.all:
+            raise ValueError(f'Unknown limit strategy of {route}: '
+                             f'{settings.get("strategy")}')
+
+        storage = {**self.default, **self.routes[route]} \
+            .get('storage', Storages.redis)
+        if storage == Storages.local and \
+                settings['strategy'] != Strategies.fixed_window:
+            raise ValueError(f'Local limit of {route} must use '
+                             f'{Strategies.fixed_window}')
+
+        count = int(settings['count'] * tier_config.get('multiplier', 1))
+        limit = RouteLimit(count=count,
+                           strategy=settings['strategy'],
+                           window=int(settings['window']),
+                           storage=storage)
+        self.resolved[route, tier] = limit
+        return limit
+
+    def get(self, route: str, tier: str or None) -> RouteLimit:
+        limit = self.resolved.get((route, tier))
+        return limit or self.resolved[route, None]
+
+
+def load_limits_config(path: str) -> LimitsConfig:
+    with open(path, encoding='utf-8') as file:
+        return LimitsConfig(json.load(file))
+
+
+def get_remote_address() -> str:
+    return request.remote_addr or '127.0.0.1'
 
 
 def get_user_id():
@@ -50,46 +233,195 @@ def get_user_id():
     return user_id
 
 
-class LimitTypes(Enum):
-    ip = 'ip'
-    user = 'user'
+def get_user_tier(user_types: UserTypeCache) -> str or None:
+    """ Tier of the cached current user, no DB query """
+    if isinstance(current_user, AnonymousUserMixin):
+        return
+    user_type = user_types.get(current_user.user_type)
+    return user_type.name if user_type else None
+
+
+def format_limit_key(limit_type: LimitTypes, strategy: str,
+                     identity: str, endpoint: str, method: str) -> str:
+    return f'LIMITS/{strategy}/{limit_type.value}/{identity}/' \
+           f'{endpoint}/{method}'
+
+
+def get_limit_key(limit_type: LimitTypes, strategy: str) -> str:
+    identity = get_remote_address() if limit_type is LimitTypes.ip \
+        else get_user_id()
+    return format_limit_key(limit_type, strategy, identity,
+                            request.endpoint, request.method)
+
+
+class CombinedLimiter:
+    """
+    Limits of several kinds checked and counted by one script call,
+    i.e. one Redis round trip per request.
+    Limits refused by Redis are remembered in a local LRU until
+    the wait ends, repeated hits costing at least as much as the
+    refused one don't reach Redis at all.
+    """
+
+    def __init__(self, sess: Redis, local_size: int = 0):
+        self.script = sess.register_script(HIT_SCRIPT)
+        self.local_size = local_size
+        self.lock = Lock()
+        self.blocked: OrderedDict = OrderedDict()
+
+    def blocked_locally(self, keys: List[str], cost: int) -> bool:
+        """ Hits cheaper than the refused one may still fit """
+
+        if not self.local_size:
+            return False
+
+        now = monotonic()
+        with self.lock:
+            for key in keys:
+                blocked = self.blocked.get(key)
+                if blocked is None:
+                    continue
+                until, refused_cost = blocked
+                if until <= now:
+                    del self.blocked[key]
+                elif cost >= refused_cost:
+                    return True
+        return False
+
+    def block_locally(self, key: str, seconds: float, cost: int):
+        if not self.local_size:
+            return
+
+        with self.lock:
+            self.blocked[key] = (monotonic() + seconds, cost)
+            self.blocked.move_to_end(key)
+            while len(self.blocked) > self.local_size:
+                self.blocked.popitem(last=False)
+
+    @staticmethod
+    def get_args(keys: List[str], limit: RouteLimit,
+                 cost: int) -> list:
+        args = [cost, int(time() * 1000)]
+        for _ in keys:
+            args += [limit.strategy, limit.count, limit.window * 1000]
+        args.append(token_hex(8))
+        return args
+
+    def allowed(self, keys: List[str], cost: int, refused: int,
+                wait: int) -> bool:
+        if refused:
+            self.block_locally(keys[refused - 1], wait / 1000, cost)
+            return False
+        return True
+
+    def hit(self, keys: List[str], limit: RouteLimit,
+            cost: int = 1) -> bool:
+        if self.blocked_locally(keys, cost):
+            return False
+
+        refused, wait = self.script(
+            keys=keys, args=self.get_args(keys, limit, cost))
+        return self.allowed(keys, cost, refused, wait)
+
+
+class AsyncCombinedLimiter(CombinedLimiter):
+    """ CombinedLimiter on a redis.asyncio client, for asgi.py """
+
+    async def hit(self, keys: List[str], limit: RouteLimit,
+                  cost: int = 1) -> bool:
+        if self.blocked_locally(keys, cost):
+            return False
+
+        refused, wait = await self.script(
+            keys=keys, args=self.get_args(keys, limit, cost))
+        return self.allowed(keys, cost, refused, wait)
+
+
+class LocalLimiter:
+    """
+    Approximate fixed windows counted in the worker's memory,
+    so each worker allows the whole count. Only the size most
+    recently seen clients are kept.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.lock = Lock()
+        self.windows: OrderedDict = OrderedDict()
+
+    def hit(self, keys: List[str], limit: RouteLimit,
+            cost: int = 1) -> bool:
+        now = monotonic()
+        with self.lock:
+            windows = []
+            for key in keys:
+                started, count = self.windows.get(key, (now, 0))
+                if now - started >= limit.window:
+                    started, count = now, 0
+                if count + cost > limit.count:
+                    return False
+                windows.append((key, started, count))
+
+            for key, started, count in windows:
+                self.windows[key] = (started, count + cost)
+                self.windows.move_to_end(key)
+            while len(self.windows) > self.size:
+                self.windows.popitem(last=False)
+        return True
+
+
+def init_limit(sess: Redis, config: LimitsConfig,
+               user_types: UserTypeCache, local_size: int = 0,
+               local_limiter_size: int = 0) -> \
+        Callable[..., LimitDecorator]:
+    limiter = CombinedLimiter(sess, local_size)
+    local_limiter = LocalLimiter(local_limiter_size)
+
+    def create_local_limit(route: str, cost: Cost) -> LimitDecorator:
+        limit = config.get(route, None)
+
+        def decorator(func: Callable) -> Callable:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                # Client address only, current_user may need Redis
+                keys = [get_limit_key(LimitTypes.ip, Storages.local)]
+                hit_cost = cost() if callable(cost) else cost
+                if not local_limiter.hit(keys, limit, hit_cost):
+                    return limit_response(None)
+                return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def create_limit(route: str,
+                     limit_types: Iterable[LimitTypes] = (
+                             LimitTypes.ip, LimitTypes.user),
+                     cost: Cost = 1) -> LimitDecorator:
+        limit_types = list(limit_types)
+        if config.get(route, None).storage == Storages.local:
+            return create_local_limit(route, cost)
+
+        def decorator(func: Callable) -> Callable:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                limit = config.get(route, get_user_tier(user_types))
+                keys = [get_limit_key(limit_type, limit.strategy)
+                        for limit_type in limit_types]
+                hit_cost = cost() if callable(cost) else cost
+                if not limiter.hit(keys, limit, hit_cost):
+                    return limit_response(None)
+                return func(*args, **kwargs)
 
+            return wrapper
 
-def init_limit(app: Flask, redis_uri: str, redis_params) -> \
-        Callable[[int, LimitTypes], LimitDecorator]:
-    ip_limiter = Limiter(
-        app,
-        key_prefix='ip',
-        key_func=get_remote_address,
-        storage_uri=redis_uri,
-        storage_options=redis_params,
-        strategy="fixed-window"
-    )
-
-    user_limiter = Limiter(
-        app, key_func=lambda: get_user_id(),
-        key_prefix='user',
-        storage_uri=redis_uri,
-        storage_options=redis_params,
-        strategy="fixed-window"
-    )
-
-    def create_limit(count: int, limit_type: LimitTypes):
-        if limit_type is LimitTypes.ip:
-            return ip_limiter.limit(
-                f"{count} per 1 minute",
-                on_breach=limit_response,
-                per_method=True)
-        elif limit_type is LimitTypes.user:
-            return user_limiter.limit(
-                f"{count} per 1 minute",
-                on_breach=limit_response,
-                per_method=True)
+        return decorator
 
     return create_limit
 
 
 def limit_response(_):
+    metrics.count_rate_limited()
     return make_response(AbortResponse(
         ok=False, code=errors.TooManyRequestsError.code,
         description=errors.TooManyRequestsError.description), 429)
@@ -9,55 +9,86 @@ import os
 
 from flask import Flask
 from flask_login import LoginManager
+from jinja2 import FileSystemBytecodeCache
 
 
 from handlers import index, grant, \
     helpdesk, \
     error_handlers, user, channel, mixin, service
+from handlers import metrics as metrics_handler
 
+import metrics
 import my_limits
 
-from storage.db_session import base_init
+from storage.db_session import base_init, RequestSession
+from storage.user_type_cache import UserTypeCache
 from redis_storage.redis_session import base_init as redis_base_init
-from version import version
+from redis_storage.user_cache import UserCache
+from version import get_version
 
-# Flask init
-app = Flask(__name__)
 
-login_manager = LoginManager()
-login_manager.init_app(app)
-
-app.config["SECRET_KEY"] = os.getenv('secret_key')
-
-
-@app.after_request
 def add_header(response):
-    response.headers['X-Powered-By'] = version
+    response.headers['X-Powered-By'] = get_version()
     return response
 
 
-# Database init
-SessObject = base_init()
-RedisSessObject = redis_base_init()
-
-limit_generator = my_limits.limit_generator(app)
-
-# Blueprints registration
-app.register_blueprint(index.create_handler(limit_generator))
-app.register_blueprint(
-    channel.create_handler(
-        SessObject, RedisSessObject, limit_generator)
-)
+def create_app(config: dict = None) -> Flask:
+    """
+    Builds the panel app. Nothing connects to Postgres or Redis
+    until the first request needs it, the schema is created
+    by service.py.
+    """
+
+    # Flask init
+    # Static files are served from memory by handlers.service
+    app = Flask(__name__, static_folder=None)
+
+    login_manager = LoginManager()
+    login_manager.init_app(app)
+
+    app.config["SECRET_KEY"] = os.getenv('secret_key')
+    app.config.update(config or {})
+
+    # Compiled templates survive restarts,
+    # pages render faster on cold start
+    if os.getenv('jinja_bytecode_cache'):
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(
+            os.getenv('jinja_bytecode_cache'))
+
+    app.after_request(add_header)
+    # Before the session teardown, so metrics see its commit
+    metrics.init_app(app)
+
+    # Database init
+    sess_maker = base_init()
+    sess_object = RequestSession(sess_maker)
+    sess_object.init_app(app)
+    redis_sess_object = redis_base_init()
+    user_types = UserTypeCache(sess_maker, redis_sess_object)
+    user_cache = UserCache(redis_sess_object)
+
+    limit_generator = my_limits.limit_generator(user_types)
+
+    # Blueprints registration
+    app.register_blueprint(index.create_handler(limit_generator))
+    app.register_blueprint(
+        channel.create_handler(sess_object, limit_generator, user_types)
+    )
+
+    app.register_blueprint(user.create_handler(sess_object, login_manager,
+                                               limit_generator, user_types,
+                                               user_cache))
+    app.register_blueprint(
+        mixin.create_handler(sess_object, limit_generator))
+    app.register_blueprint(
+        grant.create_handler(sess_object, limit_generator))
+    app.register_blueprint(helpdesk.create_handler(limit_generator))
+    app.register_error_handler(401, error_handlers.error_401)
+    app.register_blueprint(service.create_handler(limit_generator))
+    app.register_blueprint(metrics_handler.create_handler())
+
+    return app
 
-app.register_blueprint(user.create_handler(SessObject, login_manager,
-                                           limit_generator))
-app.register_blueprint(mixin.create_handler(
-    SessObject, RedisSessObject, limit_generator))
-app.register_blueprint(grant.create_handler(
-    SessObject, RedisSessObject, limit_generator))
-app.register_blueprint(helpdesk.create_handler())
-app.register_error_handler(401, error_handlers.error_401)
-app.register_blueprint(service.create_handler())
 
 if __name__ == "__main__":
-    app.run(port=5000, host="127.0.0.1")
+    create_app().run(port=5000, host="127.0.0.1")
@@ -65,6 +65,12 @@ class CreateKeyForm(FlaskForm):
                                    false_values=["0"])
 
 
+class CreateKeysForm(CreateKeyForm):
+    """ WTForm for batch key creating """
+
+    count = IntegerField("Количество", default=1)
+
+
 class ToggleKeyActiveForm(FlaskForm):
     key = HiddenField("", validators=[DataRequired()])
 
@@ -0,0 +1,105 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+# Production gunicorn settings:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+
+# Patch before anything imports socket, ssl or psycopg2
+from gevent import monkey
+
+monkey.patch_all()
+
+from psycogreen.gevent import patch_psycopg
+
+patch_psycopg()
+
+import gc
+import multiprocessing
+import os
+from os import getenv
+
+from redis_storage.params_creator import get_pool_params, \
+    get_limits_pool_params
+from storage.url_creator import create_pool_params, get_int_env
+
+db_pool = create_pool_params()
+# One worker may hold all connections of its pool and overflow
+db_connections = db_pool['pool_size'] + db_pool['max_overflow']
+redis_connections = get_pool_params()['max_connections'] + \
+    get_limits_pool_params()['max_connections']
+
+# outbox_worker.py holds a session and a LISTEN connection,
+# service.py one more while it runs
+db_reserved = get_int_env('psql_reserved_connections', 3)
+# Both use one Redis connection, raise it for other clients
+# of the server such as brokers
+redis_reserved = get_int_env('redis_reserved_clients', 2)
+
+
+def get_workers() -> int:
+    """
+    2 * cores + 1, but no more than Postgres and Redis can serve
+    when every worker fills its pools.
+    """
+
+    by_cpu = multiprocessing.cpu_count() * 2 + 1
+    by_db = (get_int_env('psql_max_connections', 100) - db_reserved) \
+        // db_connections
+    by_redis = (get_int_env('redis_max_clients', 10000) -
+                redis_reserved) // redis_connections
+    return max(1, min(by_cpu, by_db, by_redis))
+
+
+bind = getenv('web_bind') or '0.0.0.0:5000'
+worker_class = 'gevent'
+workers = get_int_env('web_workers', 0) or get_workers()
+# A request holds at most one DB and one Redis connection,
+# more greenlets would only queue for the pools
+worker_connections = get_int_env('web_worker_connections', 0) or \
+    min(db_connections, get_pool_params()['max_connections'])
+
+# Import the app once in the master, workers share its memory
+preload_app = True
+
+
+def on_starting(server):
+    # Values of workers from the previous run would be summed in
+    metrics_dir = getenv('PROMETHEUS_MULTIPROC_DIR')
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for name in os.listdir(metrics_dir):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def when_ready(server):
+    server.log.info(f'{workers} workers, '
+                    f'{worker_connections} connections each')
+
+
+def pre_fork(server, worker):
+    # Objects of the preloaded app are never collected in workers,
+    # so the collector doesn't touch and copy their pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from storage import db_session
+    from redis_storage.redis_session import reset_pools
+
+    # Sockets opened by the master must not be shared
+    if db_session.engine is not None:
+        db_session.engine.dispose(close=False)
+    reset_pools()
+
+
+def child_exit(server, worker):
+    if getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        # Drops live gauges of the dead worker
+        multiprocess.mark_process_dead(worker.pid)
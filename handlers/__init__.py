@@ -32,6 +32,7 @@ class ApiRoutes:
     RenameChannel = '/do/rename_channel'
 
     Grant = '/do/grant'
+    GrantBatch = '/do/grant_batch'
     GetKeys = '/do/get_keys'
     ToggleKey = '/do/toggle_key'
     DeleteKey = '/do/delete_key'
@@ -0,0 +1,154 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+import gzip
+import logging
+import mimetypes
+import os
+import re
+from hashlib import sha256
+from typing import NamedTuple, Dict, Iterable
+
+from flask import Response, abort, request, render_template
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bundles with a content hash in the name, e.g. main.3f2a1b9c.js
+FINGERPRINT = re.compile(r'\.[0-9a-f]{8,}\.')
+
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json',
+                'application/manifest+json', 'application/xml',
+                'image/svg+xml')
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+
+class Encodings:
+    brotli = 'br'
+    gzip = 'gzip'
+
+
+class CachedAsset(NamedTuple):
+    body: bytes
+    encoded: Dict[str, bytes]
+    etag: str
+    mimetype: str
+    immutable: bool
+
+
+def compress(body: bytes, mimetype: str) -> Dict[str, bytes]:
+    """ Encoded variants which are smaller than the body """
+    if not mimetype.startswith(COMPRESSIBLE):
+        return {}
+
+    encoded = {Encodings.gzip: gzip.compress(body, 9, mtime=0)}
+    if brotli is not None:
+        encoded[Encodings.brotli] = brotli.compress(body)
+    return {encoding: data for encoding, data in encoded.items()
+            if len(data) < len(body)}
+
+
+def create_asset(body: bytes, mimetype: str,
+                 immutable: bool = False) -> CachedAsset:
+    return CachedAsset(
+        body=body,
+        encoded=compress(body, mimetype),
+        etag=sha256(body).hexdigest()[:32],
+        mimetype=mimetype,
+        immutable=immutable)
+
+
+def load_asset(path: str) -> CachedAsset:
+    with open(path, 'rb') as file:
+        body = file.read()
+
+    mimetype = mimetypes.guess_type(path)[0] or \
+        'application/octet-stream'
+    return create_asset(
+        body, mimetype,
+        FINGERPRINT.search(os.path.basename(path)) is not None)
+
+
+def load_assets(root: str,
+                names: Iterable[str]) -> Dict[str, CachedAsset]:
+    """ Files of root which exist, the front may be not deployed """
+    return {name: load_asset(os.path.join(root, name)) for name in names
+            if os.path.isfile(os.path.join(root, name))}
+
+
+def load_directory(root: str) -> Dict[str, CachedAsset]:
+    """ Every file under root by its relative posix path """
+    names = []
+    for directory, _, files in os.walk(root):
+        for name in files:
+            path = os.path.relpath(os.path.join(directory, name), root)
+            names.append(path.replace(os.sep, '/'))
+
+    assets = load_assets(root, names)
+    logging.info(f'Loaded {len(assets)} assets from {root}')
+    return assets
+
+
+def get_encoding(asset: CachedAsset) -> str or None:
+    for encoding in (Encodings.brotli, Encodings.gzip):
+        if encoding in asset.encoded and \
+                request.accept_encodings.quality(encoding):
+            return encoding
+
+
+def asset_response(asset: CachedAsset) -> Response:
+    """
+    Response from memory with a strong ETag per encoding.
+    Fingerprinted assets are cached forever, others revalidated.
+    """
+
+    encoding = get_encoding(asset)
+    etag = f'{asset.etag}-{encoding}' if encoding else asset.etag
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = asset.encoded[encoding] if encoding else asset.body
+        response = Response(body, mimetype=asset.mimetype)
+        if encoding:
+            response.content_encoding = encoding
+
+    response.set_etag(etag)
+    if asset.encoded:
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE \
+        if asset.immutable else REVALIDATE_CACHE
+    return response
+
+
+def serve_asset(assets: Dict[str, CachedAsset], name: str) -> Response:
+    asset = assets.get(name)
+    if asset is None:
+        abort(404)
+    return asset_response(asset)
+
+
+class PageCache:
+    """
+    Templates which don't depend on the request, rendered once
+    per worker on their first request and served like assets.
+    """
+
+    def __init__(self):
+        self.pages: Dict[str, CachedAsset] = {}
+
+    def serve(self, template: str) -> Response:
+        page = self.pages.get(template)
+        if page is None:
+            page = create_asset(render_template(template).encode('utf-8'),
+                                'text/html')
+            self.pages[template] = page
+        return asset_response(page)
@@ -5,24 +5,26 @@
 #  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
 #  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
 
-from typing import ClassVar, TypedDict, NamedTuple, Iterable, Callable
+from typing import ClassVar, TypedDict, NamedTuple, Iterable, Callable, \
+    List
 
+import sqlalchemy
 from flask import Blueprint, jsonify
 from flask_login import current_user, login_required
 from http import HTTPStatus
-from flask_limiter.extension import LimitDecorator
 
-from redis import Redis
-import redis_storage
 
 from forms import RegisterChannelForm, RenameChannelForm
-from content_limits import LimitTypes, Limits
+from content_limits import Limits, LimitDecorator
 
 from storage.channel import Channel
+from storage.db_session import add_with_unique_id
 from storage.key import Key
+from storage.outbox import push, OutboxEntities
 from storage.keygen import generate_channel_id
 from storage.user import User
 from storage.user_type import UserType
+from storage.user_type_cache import UserTypeCache
 
 from . import make_abort, ApiRoutes, RequestMethods, AbortResponse
 from .errors import ChannelError, ChannelNotExistError, \
@@ -101,14 +103,10 @@ def get_base_json_channel(channel: Channel) -> ChannelJson:
                        )
 
 
-def get_json_channel(channel: Channel, session: ClassVar) -> \
-        ChannelJson:
+def get_stats_json_channel(channel: Channel,
+                           keys_stats: KeysCount) -> ChannelJson:
     json_channel = get_base_json_channel(channel)
 
-    keys = session.query(Key).filter(
-        Key.chan_id == channel.id).all()
-
-    keys_stats = get_keys_count(keys)
     json_channel['read_keys'] = keys_stats.can_read
     json_channel['write_keys'] = keys_stats.can_write
 
@@ -123,6 +121,54 @@ def get_json_channel(channel: Channel, session: ClassVar) -> \
     return json_channel
 
 
+def get_json_channel(channel: Channel, session: ClassVar) -> \
+        ChannelJson:
+    keys = session.query(Key).filter(
+        Key.chan_id == channel.id).all()
+
+    return get_stats_json_channel(channel, get_keys_count(keys))
+
+
+def get_keys_count_columns() -> tuple:
+    """
+    Aggregates for read/write x active/inactive key counts,
+    computed by bit tests on Key.perm.
+    """
+
+    can_read = Key.perm.op('&')(Key.READ) != 0
+    can_write = Key.perm.op('&')(Key.WRITE) != 0
+    active = Key.perm.op('&')(Key.PAUSED) == 0
+
+    def count(*conditions):
+        return sqlalchemy.func.count(Key.key).filter(
+            sqlalchemy.and_(*conditions))
+
+    return (count(can_read, active),
+            count(can_read, sqlalchemy.not_(active)),
+            count(can_write, active),
+            count(can_write, sqlalchemy.not_(active)))
+
+
+def get_json_channels(user: User, session: ClassVar) -> \
+        List[ChannelJson]:
+    """
+    All user's channels with keys stats in one aggregated query.
+    """
+
+    rows = session.query(Channel, *get_keys_count_columns()) \
+        .outerjoin(Key, Key.chan_id == Channel.id) \
+        .filter(Channel.owner_id == user.id) \
+        .group_by(Channel.id).all()
+
+    return [get_stats_json_channel(channel, KeysCount(
+        can_read=KeysTypesCount(active=read_active,
+                                inactive=read_inactive),
+        can_write=KeysTypesCount(active=write_active,
+                                 inactive=write_inactive)))
+            for (channel, read_active, read_inactive,
+                 write_active, write_inactive) in rows]
+
+
 def get_valid_channel_name(channel_name: str or None) -> str:
     if not channel_name:
         return ''
@@ -219,8 +265,8 @@ def get_user_channels(user: User, session: ClassVar):
 
 
 def create_handler(sess_cr: ClassVar,
-                   rds_sess: Redis,
-                   limits: Callable[[int, LimitTypes], LimitDecorator]
+                   limits: Callable[..., LimitDecorator],
+                   user_types: UserTypeCache
                    ) -> Blueprint:
     """
     A closure for instantiating the handler
@@ -232,16 +278,14 @@ def create_handler(sess_cr: ClassVar,
     app = Blueprint("channel", __name__)
 
     @app.route(ApiRoutes.CreateChannel, methods=[RequestMethods.POST])
-    @limits(Limits.ChannelCreate, LimitTypes.ip)
-    @limits(Limits.ChannelCreate, LimitTypes.user)
+    @limits(Limits.ChannelCreate)
     @login_required
     def do_create_channel():
         session = sess_cr()
 
         channel_count = len(
             get_user_channels(current_user, session))
-        user_quota: UserType = session.query(UserType).filter(
-            UserType.type_id == current_user.user_type).first()
+        user_quota: UserType = user_types.get(current_user.user_type)
 
         if channel_count >= user_quota.max_channel_count:
             return make_abort(AbortResponse(
@@ -269,7 +313,6 @@ def create_handler(sess_cr: ClassVar,
 
         channel = Channel(
             name=channel_name,
-            id=generate_channel_id(),
             owner_id=current_user.id,
             max_message_size=max_message_size,
             need_bufferization=need_bufferization,
@@ -278,34 +321,20 @@ def create_handler(sess_cr: ClassVar,
             end_to_end_data_encryption=end_to_end_data_encryption
         )
 
-        session.add(channel)
+        add_with_unique_id(session, channel, 'id', generate_channel_id)
+        push(session, OutboxEntities.channel, channel.id)
         session.commit()
-        redis_storage.add_channel(
-            sess=rds_sess,
-            channel_id=channel.id,
-            data=dict(channel)
-        )
         return jsonify(get_base_json_channel(channel))
 
     @app.route(ApiRoutes.GetChannels, methods=[RequestMethods.GET])
-    @limits(Limits.GetChannels, LimitTypes.ip)
-    @limits(Limits.GetChannels, LimitTypes.user)
+    @limits(Limits.GetChannels)
     @login_required
     def do_get_channels():
         session = sess_cr()
-        channels = session.query(Channel) \
-            .filter(Channel.owner_id == current_user.id).all()
-        if not channels:
-            return jsonify([])
-
-        json_channels = [get_json_channel(channel, session)
-                         for channel in channels]
-
-        return jsonify(json_channels)
+        return jsonify(get_json_channels(current_user, session))
 
     @app.route(ApiRoutes.RenameChannel, methods=[RequestMethods.PUT])
-    @limits(Limits.ChannelRename, LimitTypes.ip)
-    @limits(Limits.ChannelRename, LimitTypes.user)
+    @limits(Limits.ChannelRename)
     @login_required
     def do_edit_channel():
         """ Handler for settings changing page. """
@@ -335,6 +364,7 @@ def create_handler(sess_cr: ClassVar,
             ), HTTPStatus.FORBIDDEN)
 
         channel.name = channel_name
+        push(session, OutboxEntities.channel, channel.id)
         session.commit()
 
         return jsonify(get_json_channel(channel, sess_cr()))
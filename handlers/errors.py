@@ -96,6 +96,11 @@ class BadKeyError(GrantError):
     description = "Invalid key"
 
 
+class BadKeyCountError(GrantError):
+    code = 804
+    description = "Bad key count"
+
+
 class AlreadyMixedError(MixinError):
     code = 900
     description = "Already mixed"
@@ -6,32 +6,33 @@
 #  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
 
 from datetime import datetime
-from typing import ClassVar, TypedDict, NamedTuple, Literal, Callable
+from typing import ClassVar, TypedDict, NamedTuple, Literal, Callable, \
+    List
 
 from flask import Blueprint, request, jsonify
-from flask_limiter.extension import LimitDecorator
 from flask_login import current_user, login_required
 from http import HTTPStatus
 
-from redis import Redis
-
-from content_limits import LimitTypes, Limits
-from forms import CreateKeyForm, ToggleKeyActiveForm, DeleteKeyForm
+from content_limits import Limits, LimitDecorator
+from forms import CreateKeyForm, CreateKeysForm, ToggleKeyActiveForm, \
+    DeleteKeyForm
 
 from storage.channel import Channel
+from storage.db_session import add_with_unique_id, \
+    insert_with_unique_ids
 from storage.key import Key
 from storage.keygen import generate_key
 from storage.mixin import Mixin
-from redis_storage import set_key_permissions, \
-    set_key_channel_id
-import redis_storage
+from storage.outbox import push, push_many, OutboxEntities
+from storage.user import User
 
 from . import make_abort, ApiRoutes, RequestMethods, AbortResponse
 from handlers.channel import confirm_channel
 from .errors import GrantError, BadChannelIdError, BadKeyError, \
-    ChannelNotExistError
+    ChannelError, ChannelNotExistError, BadKeyCountError
 
 MAX_KEY_NAME_LENGTH = 20
+MAX_KEYS_BATCH = 100
 
 
 class KeyJson(TypedDict):
@@ -83,6 +84,22 @@ def get_json_key(key: Key) -> KeyJson:
                    channel=key.chan_id)
 
 
+def get_channel_keys(session: ClassVar, channel_id: str, user: User
+                     ) -> (List[KeyJson], ChannelError or None):
+    """ Keys of the user's channel, or why they can't be listed """
+
+    channel = session.query(Channel). \
+        filter(Channel.id == channel_id).first()
+
+    error = confirm_channel(channel, user)
+    if error:
+        return [], error
+
+    keys = session.query(Key). \
+        filter(Key.chan_id == channel_id).all()
+    return [get_json_key(key) for key in keys], None
+
+
 def create_perm(info: bool, read: bool, write: bool,
                 disallow_mixins: bool):
     return disallow_mixins << 3 | info << 2 | write << 1 | read
@@ -112,8 +129,25 @@ def confirm_create_key_form(form: CreateKeyForm
     ), None
 
 
-def create_handler(sess_cr: ClassVar, rds_sess: Redis,
-                   limits: Callable[[int, LimitTypes], LimitDecorator]
+def get_valid_keys_count(count: int or None) -> int:
+    if count is None or not 0 < count <= MAX_KEYS_BATCH:
+        return 0
+    return count
+
+
+def get_batch_cost() -> int:
+    """
+    Batch grant costs as many rate limit hits as keys it creates.
+    """
+
+    count = request.form.get('count', '')
+    if not count.isdigit():
+        return 1
+    return get_valid_keys_count(int(count)) or 1
+
+
+def create_handler(sess_cr: ClassVar,
+                   limits: Callable[..., LimitDecorator]
                    ) -> Blueprint:
     """
     A closure for instantiating the handler
@@ -124,8 +158,7 @@ def create_handler(sess_cr: ClassVar, rds_sess: Redis,
     app = Blueprint("grant", __name__)
 
     @app.route(ApiRoutes.Grant, methods=[RequestMethods.POST])
-    @limits(Limits.KeyCreate, LimitTypes.ip)
-    @limits(Limits.KeyCreate, LimitTypes.user)
+    @limits(Limits.KeyCreate)
     @login_required
     def do_grant():
         form = CreateKeyForm(request.form)
@@ -153,22 +186,64 @@ def create_handler(sess_cr: ClassVar, rds_sess: Redis,
                               description=error.description),
                 HTTPStatus.FORBIDDEN)
 
-        key_id = generate_key()
-        key = Key(key=key_id, chan_id=channel_id,
+        key = Key(chan_id=channel_id,
                   name=name, created=datetime.now(),
                   perm=perm)
 
-        session.add(key)
+        add_with_unique_id(session, key, 'key', generate_key)
+        push(session, OutboxEntities.key, key.key)
         session.commit()
 
-        set_key_permissions(rds_sess, key.key, perm)
-        set_key_channel_id(rds_sess, key.key, channel_id)
-
         return jsonify(get_json_key(key))
 
+    @app.route(ApiRoutes.GrantBatch, methods=[RequestMethods.POST])
+    @limits(Limits.KeyBatchCreate, cost=get_batch_cost)
+    @login_required
+    def do_grant_batch():
+        """ Handler for creating several keys with same settings """
+        form = CreateKeysForm(request.form)
+
+        (channel_id, name, perm), error = \
+            confirm_create_key_form(form)
+
+        count = get_valid_keys_count(form.count.data)
+        if not error and not count:
+            error = BadKeyCountError()
+
+        if error:
+            return make_abort(
+                AbortResponse(ok=False,
+                              code=error.code,
+                              description=error.description),
+                HTTPStatus.UNPROCESSABLE_ENTITY)
+
+        session = sess_cr()
+
+        channel = session.query(Channel). \
+            filter(Channel.id == channel_id).first()
+
+        error = confirm_channel(channel, current_user)
+        if error:
+            return make_abort(
+                AbortResponse(ok=False,
+                              code=error.code,
+                              description=error.description),
+                HTTPStatus.FORBIDDEN)
+
+        created = datetime.now()
+        rows = [dict(chan_id=channel_id, name=name,
+                     created=created, perm=perm)
+                for _ in range(count)]
+
+        insert_with_unique_ids(session, Key, rows, 'key', generate_key)
+        push_many(session, OutboxEntities.key,
+                  (row['key'] for row in rows))
+        session.commit()
+
+        return jsonify([get_json_key(Key(**row)) for row in rows])
+
     @app.route(ApiRoutes.GetKeys, methods=[RequestMethods.GET])
-    @limits(Limits.GetKeys, LimitTypes.ip)
-    @limits(Limits.GetKeys, LimitTypes.user)
+    @limits(Limits.GetKeys)
     @login_required
     def do_get_keys():
         channel_id = request.args.get('channel_id', '')
@@ -181,12 +256,8 @@ def create_handler(sess_cr: ClassVar, rds_sess: Redis,
                     description=ChannelNotExistError.description),
                 HTTPStatus.UNPROCESSABLE_ENTITY)
 
-        session = sess_cr()
-
-        channel: Channel = session.query(Channel). \
-            filter(Channel.id == channel_id).first()
-
-        error = confirm_channel(channel, current_user)
+        keys_json, error = get_channel_keys(sess_cr(), channel_id,
+                                            current_user)
         if error:
             return make_abort(AbortResponse(
                 ok=False,
@@ -194,15 +265,10 @@ def create_handler(sess_cr: ClassVar, rds_sess: Redis,
                 description=error.description
             ), HTTPStatus.FORBIDDEN)
 
-        keys = session.query(Key). \
-            filter(Key.chan_id == channel_id).all()
-        keys_json = [get_json_key(key) for key in keys]
-
         return jsonify(keys_json)
 
     @app.route(ApiRoutes.ToggleKey, methods=[RequestMethods.PUT])
-    @limits(Limits.KeyToggle, LimitTypes.ip)
-    @limits(Limits.KeyToggle, LimitTypes.user)
+    @limits(Limits.KeyToggle)
     @login_required
     def do_toggle_key():
         form = ToggleKeyActiveForm(request.form)
@@ -233,14 +299,13 @@ def create_handler(sess_cr: ClassVar, rds_sess: Redis,
             ), HTTPStatus.FORBIDDEN)
 
         key.toggle_active()
+        push(session, OutboxEntities.key, key.key)
         session.commit()
 
-        set_key_permissions(rds_sess, key.key, key.perm)
         return jsonify(get_json_key(key))
 
     @app.route(ApiRoutes.DeleteKey, methods=[RequestMethods.POST])
-    @limits(Limits.KeyDelete, LimitTypes.ip)
-    @limits(Limits.KeyDelete, LimitTypes.user)
+    @limits(Limits.KeyDelete)
     @login_required
     def delete_key():
         """ Handler for deletion of keys """
@@ -270,14 +335,18 @@ def create_handler(sess_cr: ClassVar, rds_sess: Redis,
                 description=error.description
             ), HTTPStatus.FORBIDDEN)
 
+        # Channels mixed in by this key lose the mixin in Redis too
+        source_channels = session.query(Mixin.source_channel) \
+            .filter(Mixin.linked_by == key.key).distinct().all()
         session.query(Mixin).filter(
             Mixin.linked_by == key.key).delete()
 
         session.delete(key)
+        push(session, OutboxEntities.key, key.key)
+        push_many(session, OutboxEntities.channel,
+                  (channel_id for channel_id, in source_channels))
         session.commit()
 
-        redis_storage.delete_key(rds_sess, key.key)
-
         return {'key': key.key}
 
     return app
@@ -5,10 +5,16 @@
 #  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
 #  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
 
-from flask import Blueprint, render_template
+from typing import Callable
 
+from flask import Blueprint
 
-def create_handler() -> Blueprint:
+from content_limits import Limits, LimitDecorator
+from .assets import PageCache
+
+
+def create_handler(limits: Callable[..., LimitDecorator]
+                   ) -> Blueprint:
     """
     A closure for instantiating the handler
     that maintains helpdesk processes.
@@ -17,46 +23,54 @@ def create_handler() -> Blueprint:
     """
 
     app = Blueprint("helpdesk", __name__)
+    pages = PageCache()
 
     @app.route("/helpdesk")
+    @limits(Limits.Helpdesk)
     def helpdesk():
         """ Main helpdesk """
 
-        return render_template("helpdesk/helpdesk.html")
+        return pages.serve("helpdesk/helpdesk.html")
 
     @app.route("/helpdesk/channels_create")
+    @limits(Limits.Helpdesk)
     def helpdesk_ch_cr():
         """ Helpdesk for creating channels """
 
-        return render_template("helpdesk/channels_create.html")
+        return pages.serve("helpdesk/channels_create.html")
 
     @app.route("/helpdesk/channels_edit")
+    @limits(Limits.Helpdesk)
     def helpdesk_ch_ed():
         """ Helpdesk for editing channels """
 
-        return render_template("helpdesk/channels_edit.html")
+        return pages.serve("helpdesk/channels_edit.html")
 
     @app.route("/helpdesk/keys_create")
+    @limits(Limits.Helpdesk)
     def helpdesk_keys_cr():
         """ Helpdesk for creating keys """
 
-        return render_template("helpdesk/keys_create.html")
+        return pages.serve("helpdesk/keys_create.html")
 
     @app.route("/helpdesk/keys_perm")
+    @limits(Limits.Helpdesk)
     def helpdesk_keys_pe():
         """ Key's permissions helpdesk """
 
-        return render_template("helpdesk/keys_perm.html")
+        return pages.serve("helpdesk/keys_perm.html")
 
     @app.route("/helpdesk/keys_revoke")
+    @limits(Limits.Helpdesk)
     def helpdesk_keys_re():
         """ Helpdesk for revoke keys"""
 
-        return render_template("helpdesk/keys_revoke.html")
+        return pages.serve("helpdesk/keys_revoke.html")
 
     @app.route("/helpdesk/mixins_create")
+    @limits(Limits.Helpdesk)
     def helpdesk_mixins_cr():
         """ Helpdesk for revoke keys"""
 
-        return render_template("helpdesk/mixins_create.html")
+        return pages.serve("helpdesk/mixins_create.html")
     return app
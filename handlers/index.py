@@ -7,14 +7,14 @@
 
 from typing import Callable
 
-from flask import Blueprint, render_template
-from flask_limiter.extension import LimitDecorator
+from flask import Blueprint
 
-from content_limits import LimitTypes, Limits
+from content_limits import Limits, LimitDecorator
 from . import RequestMethods
+from .assets import PageCache
 
 
-def create_handler(limits: Callable[[int, LimitTypes], LimitDecorator]
+def create_handler(limits: Callable[..., LimitDecorator]
                    ) -> Blueprint:
     """
     A closure for instantiating the handler
@@ -23,12 +23,12 @@ def create_handler(limits: Callable[[int, LimitTypes], LimitDecorator]
     """
 
     app = Blueprint("index", __name__)
+    pages = PageCache()
 
     @app.route("/", methods=[RequestMethods.GET])
-    @limits(Limits.GetKeys, LimitTypes.ip)
-    @limits(Limits.GetKeys, LimitTypes.user)
+    @limits(Limits.Index)
     def index():
         """ Handler for main page """
-        return render_template("index.html")
+        return pages.serve("index.html")
 
     return app
@@ -0,0 +1,51 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+import hmac
+import os
+from http import HTTPStatus
+
+from flask import Blueprint, Response, abort, request
+from prometheus_client import CONTENT_TYPE_LATEST
+
+import metrics
+from . import RequestMethods
+
+# Bearer token required by /metrics
+METRICS_TOKEN = os.getenv('metrics_token')
+# Serve /metrics without a token, e.g. when the port isn't public
+METRICS_PUBLIC = os.getenv('metrics_public', '0') == '1'
+
+
+def authorized() -> bool:
+    if METRICS_TOKEN:
+        return hmac.compare_digest(
+            request.headers.get('Authorization', ''),
+            f'Bearer {METRICS_TOKEN}')
+    return METRICS_PUBLIC
+
+
+def create_handler() -> Blueprint:
+    """
+    A closure for instantiating the handler
+    that exposes Prometheus metrics. Not rate limited,
+    so scrapes are never refused. Without a token or
+    metrics_public the route answers 404.
+    """
+
+    app = Blueprint("metrics", __name__)
+
+    @app.route("/metrics", methods=[RequestMethods.GET])
+    def do_metrics():
+        # Unauthorized scrapes don't learn the route exists
+        if not authorized():
+            abort(HTTPStatus.NOT_FOUND)
+        return Response(metrics.generate(),
+                        content_type=CONTENT_TYPE_LATEST)
+
+    return app
@@ -7,22 +7,22 @@
 
 from typing import ClassVar, Callable
 
-from flask_limiter.extension import LimitDecorator
-from redis import Redis
+from sqlalchemy.exc import IntegrityError
 
 from flask import Blueprint, jsonify, request
 from flask_login import current_user, login_required
 from http import HTTPStatus
 
-from content_limits import LimitTypes, Limits
+from content_limits import Limits, LimitDecorator
 from forms import CreateMixinForm, RestrictMxForm
 
 from storage.channel import Channel
 from storage.key import Key
 from storage.mixin import Mixin
+from storage.outbox import push, OutboxEntities
 from storage.user import User
 
-from redis_storage import mixin_not_create_loop, add_mixin, delete_mixin
+from redis_storage import mixin_not_create_loop
 
 from . import make_abort, ApiRoutes, RequestMethods, AbortResponse
 from handlers.channel import confirm_channel, get_base_json_channel
@@ -74,14 +74,24 @@ def confirm_restrict_mixin_form(form: RestrictMxForm) -> \
     return
 
 
-def create_handler(sess_cr: ClassVar, rds_sess: Redis,
-                   limits: Callable[[int, LimitTypes], LimitDecorator]
+def get_mixin_channels(session: ClassVar, neighbour_column,
+                       condition) -> list:
+    """
+    Id and name of mixin neighbours in one joined query.
+    """
+
+    return session.query(Channel.id, Channel.name) \
+        .join(Mixin, Channel.id == neighbour_column) \
+        .filter(condition).all()
+
+
+def create_handler(sess_cr: ClassVar,
+                   limits: Callable[..., LimitDecorator]
                    ) -> Blueprint:
     app = Blueprint("mixin", __name__)
 
     @app.route(ApiRoutes.GetMixins, methods=[RequestMethods.GET])
-    @limits(Limits.GetMixins, LimitTypes.ip)
-    @limits(Limits.GetMixins, LimitTypes.user)
+    @limits(Limits.GetMixins)
     @login_required
     def do_get_mixins():
         channel_id = request.args.get('channel_id', '')
@@ -107,15 +117,11 @@ def create_handler(sess_cr: ClassVar, rds_sess: Redis,
                 description=error.description
             ), HTTPStatus.FORBIDDEN)
 
-        mixin_out = (session.query(Channel).filter(
-            Channel.id == mixin.dest_channel).first() for mixin in
-                     session.query(Mixin).filter(
-                         Mixin.source_channel == channel.id).all())
+        mixin_out = get_mixin_channels(session, Mixin.dest_channel,
+                                       Mixin.source_channel == channel.id)
 
-        mixin_in = (session.query(Channel).filter(
-            Channel.id == mixin.source_channel).first() for mixin in
-                    session.query(Mixin).filter(
-                        Mixin.dest_channel == channel.id).all())
+        mixin_in = get_mixin_channels(session, Mixin.source_channel,
+                                      Mixin.dest_channel == channel.id)
 
         mixin_out_json = [
             get_base_json_channel(channel) for channel in mixin_out]
@@ -127,8 +133,7 @@ def create_handler(sess_cr: ClassVar, rds_sess: Redis,
         return jsonify({'in': mixin_in_json, 'out': mixin_out_json})
 
     @app.route(ApiRoutes.CreateMixin, methods=[RequestMethods.POST])
-    @limits(Limits.MixinCreate, LimitTypes.ip)
-    @limits(Limits.MixinCreate, LimitTypes.user)
+    @limits(Limits.MixinCreate)
     @login_required
     def do_create_mixin():
         """ Handler for mixin creating. """
@@ -188,15 +193,23 @@ def create_handler(sess_cr: ClassVar, rds_sess: Redis,
                           linked_by=key.key)
 
         session.add(new_mixin)
-        session.commit()
-
-        add_mixin(rds_sess, src_channel.id, new_mixin.dest_channel)
+        try:
+            push(session, OutboxEntities.channel, src_channel.id)
+            session.commit()
+        except IntegrityError:
+            # Concurrent request created the same pair first
+            session.rollback()
+            return make_abort(AbortResponse(
+                ok=False,
+                code=AlreadyMixedError.code,
+                description=AlreadyMixedError.description
+            ),
+                HTTPStatus.BAD_REQUEST)
 
         return {"mixin": get_base_json_channel(src_channel)}
 
     @app.route(ApiRoutes.RestrictMixin, methods=[RequestMethods.POST])
-    @limits(Limits.MixinDelete, LimitTypes.ip)
-    @limits(Limits.MixinDelete, LimitTypes.user)
+    @limits(Limits.MixinDelete)
     @login_required
     def restrict_out_mx():
         """ Handler for restriction of  mixin. """
@@ -252,9 +265,9 @@ def create_handler(sess_cr: ClassVar, rds_sess: Redis,
                 HTTPStatus.BAD_REQUEST)
 
         session.delete(mixin)
+        push(session, OutboxEntities.channel, source_channel_id)
         session.commit()
 
-        delete_mixin(rds_sess, source_channel_id, dest_channel_id)
         return {'mixin': channel_2.id}
 
     return app
@@ -6,9 +6,16 @@
 #  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
 
 import os
+from typing import Callable
 
-from flask import Blueprint, send_from_directory
+from flask import Blueprint
+
+from content_limits import Limits, LimitDecorator
 from . import RequestMethods
+from .assets import load_assets, load_directory, serve_asset
+
+ROOT_FILES = ('manifest.json', 'asset-manifest.json', 'robots.txt',
+              'browserconfig.xml', 'favicon.ico', 'apple-touch-icon.png')
 
 
 def get_root_path(app: Blueprint):
@@ -16,57 +23,66 @@ def get_root_path(app: Blueprint):
                                  ).rstrip('/').rstrip('\\')
 
 
-def create_handler() -> Blueprint:
+def create_handler(limits: Callable[..., LimitDecorator]
+                   ) -> Blueprint:
     """
     A closure for instantiating the handler
-    that maintains favicon, manifest and other.
-    Must borrow a SqlAlchemy session creator for further usage.
+    that maintains favicon, manifest, static files and other.
+    Files are read and compressed once here, so restart
+    the panel after the front is updated.
     """
 
     app = Blueprint("service", __name__)
 
+    root_path = get_root_path(app)
+    root_assets = load_assets(root_path, ROOT_FILES)
+    favicon_assets = load_directory(os.path.join(root_path, 'favicon'))
+    static_assets = load_directory(os.path.join(root_path, 'static'))
+
     @app.route("/manifest.json", methods=[RequestMethods.GET])
+    @limits(Limits.Service)
     def manifest():
         """ Handler for main page """
-        return send_from_directory(
-            get_root_path(app),
-            'manifest.json')
+        return serve_asset(root_assets, 'manifest.json')
 
     @app.route("/asset-manifest.json", methods=[RequestMethods.GET])
+    @limits(Limits.Service)
     def asset_manifest():
         """ Handler for main page """
-        return send_from_directory(
-            get_root_path(app),
-            'asset-manifest.json')
+        return serve_asset(root_assets, 'asset-manifest.json')
 
     @app.route("/robots.txt", methods=[RequestMethods.GET])
+    @limits(Limits.Service)
     def robots():
         """ Handler for main page """
-        return send_from_directory(
-            get_root_path(app),
-            'robots.txt')
+        return serve_asset(root_assets, 'robots.txt')
 
     @app.route("/browserconfig.xml", methods=[RequestMethods.GET])
+    @limits(Limits.Service)
     def browserconfig():
         """ Handler for main page """
-        return send_from_directory(
-            get_root_path(app),
-            'browserconfig.xml')
+        return serve_asset(root_assets, 'browserconfig.xml')
 
     @app.route("/favicon/<favicon>", methods=[RequestMethods.GET])
+    @limits(Limits.Service)
     def favicons(favicon: str):
-        return send_from_directory(
-            os.path.join(get_root_path(app), 'favicon'), favicon)
+        return serve_asset(favicon_assets, favicon)
 
     @app.route("/favicon.ico", methods=[RequestMethods.GET])
+    @limits(Limits.Service)
     def favicon_ico():
-        return send_from_directory(get_root_path(app), 'favicon.ico')
+        return serve_asset(root_assets, 'favicon.ico')
 
     @app.route("/apple-touch-icon.png", methods=[RequestMethods.GET])
+    @limits(Limits.Service)
     def apple_touch_icon():
         """ Handler for main page """
-        return send_from_directory(
-            get_root_path(app),
-            'apple-touch-icon.png')
+        return serve_asset(root_assets, 'apple-touch-icon.png')
+
+    @app.route("/static/<path:filename>", methods=[RequestMethods.GET])
+    @limits(Limits.Service)
+    def static(filename: str):
+        """ Static files, replaces flask's static route """
+        return serve_asset(static_assets, filename)
 
     return app
@@ -10,19 +10,21 @@ from binascii import Error as DecErr
 
 from typing import ClassVar, TypedDict, NamedTuple, Callable, List
 
-from flask import Blueprint, request, jsonify, Response
-from flask_limiter.extension import LimitDecorator
+from flask import Blueprint, request, jsonify, Response, json
 from flask_login import login_required, logout_user, login_user, \
     current_user, LoginManager
 from http import HTTPStatus
 
-from content_limits import LimitTypes, Limits
+from content_limits import Limits, LimitDecorator
 from forms import RegisterForm, LoginForm, ChangeUsernameForm, \
     ChangeEmailForm, ChangePasswordForm
+from storage.db_session import add_with_unique_id
 from storage.keygen import generate_user_id
 
 from storage.user import User
 from storage.user_type import UserType
+from storage.user_type_cache import UserTypeCache
+from redis_storage.user_cache import UserCache
 
 from . import make_abort, confirm_email, ApiRoutes, RequestMethods, \
     AbortResponse
@@ -112,6 +114,11 @@ def get_quotas_json(quotas: UserType) -> QuotaJson:
     )
 
 
+def get_quotas_payload(user_types: List[UserType]) -> str:
+    quotas: List[QuotaJson] = [get_quotas_json(q) for q in user_types]
+    return json.dumps({'account_types': quotas})
+
+
 def confirm_user(user: User, password: str) -> UserError or None:
     if not user:
         return BadUserError()
@@ -213,8 +220,9 @@ def confirm_change_password_form(form: ChangePasswordForm) -> \
 
 
 def create_handler(sess_cr: ClassVar, lm: LoginManager,
-                   limits: Callable[
-                       [int, LimitTypes], LimitDecorator]
+                   limits: Callable[..., LimitDecorator],
+                   user_types: UserTypeCache,
+                   user_cache: UserCache
                    ) -> Blueprint:
     """
     A closure for instantiating the handler
@@ -226,13 +234,11 @@ def create_handler(sess_cr: ClassVar, lm: LoginManager,
     app = Blueprint("user", __name__)
 
     @lm.user_loader
-    def load_user(user_id: int):
+    def load_user(user_id: str):
         """ Function for loading the user """
 
-        session = sess_cr()
-        user = session.query(User).get(user_id)
-        session.close()
-        return user
+        return user_cache.get(
+            user_id, lambda uid: sess_cr().query(User).get(uid))
 
     @app.after_request
     def allow_cors(response: Response):
@@ -240,13 +246,10 @@ def create_handler(sess_cr: ClassVar, lm: LoginManager,
         return response
 
     @app.route(ApiRoutes.GetUser, methods=[RequestMethods.GET])
-    @limits(Limits.GetUser, LimitTypes.ip)
-    @limits(Limits.GetUser, LimitTypes.user)
+    @limits(Limits.GetUser)
     def get_user():
         if current_user.is_authenticated:
-            session = sess_cr()
-            quotas: UserType = session.query(UserType).filter(
-                UserType.type_id == current_user.user_type).first()
+            quotas: UserType = user_types.get(current_user.user_type)
 
             return jsonify(UserResponseJson(
                 auth=True, user=get_user_json(current_user),
@@ -256,18 +259,13 @@ def create_handler(sess_cr: ClassVar, lm: LoginManager,
             UserResponseJson(auth=False, user={}, path='/', quota={}))
 
     @app.route(ApiRoutes.GetQuotas, methods=[RequestMethods.GET])
-    @limits(Limits.GetUser, LimitTypes.ip)
-    @limits(Limits.GetUser, LimitTypes.user)
+    @limits(Limits.GetUser)
     def get_quotas():
-        session = sess_cr()
-        quotas: List[QuotaJson] = list(
-            get_quotas_json(q) for q in session.query(UserType).all())
-
-        return jsonify({'account_types': quotas})
+        payload = user_types.get_payload('quotas', get_quotas_payload)
+        return Response(payload, mimetype='application/json')
 
     @app.route(ApiRoutes.Register, methods=[RequestMethods.POST])
-    @limits(Limits.Register, LimitTypes.ip)
-    @limits(Limits.Register, LimitTypes.user)
+    @limits(Limits.Register)
     def register():
         """ Handler for register """
         form = RegisterForm()
@@ -292,25 +290,22 @@ def create_handler(sess_cr: ClassVar, lm: LoginManager,
             ),
                 HTTPStatus.CONFLICT)
 
-        free = session.query(UserType)\
-            .filter(UserType.name == 'Free').first()
+        free = user_types.get_by_name('Free')
         # noinspection PyArgumentList
         user = User(
-            id=generate_user_id(),
             email=email,
             username=username,
             user_type=free.type_id
         )
 
         user.set_password(password)
-        session.add(user)
+        add_with_unique_id(session, user, 'id', generate_user_id)
         session.commit()
 
         return {"status": True, "path": "/login"}
 
     @app.route(ApiRoutes.Login, methods=[RequestMethods.POST])
-    @limits(Limits.Login, LimitTypes.ip)
-    @limits(Limits.Login, LimitTypes.user)
+    @limits(Limits.Login)
     def login():
         """ Handler for login """
         form = LoginForm()
@@ -337,10 +332,13 @@ def create_handler(sess_cr: ClassVar, lm: LoginManager,
                 description=error.description
             ), HTTPStatus.FORBIDDEN)
 
+        if user.password_needs_rehash():
+            user.set_password(password)
+            session.commit()
+
         login_user(user, remember=remember)
         path = get_path(request.args.get("path", ''))
-        quotas: UserType = session.query(UserType).filter(
-            UserType.type_id == current_user.user_type).first()
+        quotas: UserType = user_types.get(current_user.user_type)
 
         return jsonify(UserResponseJson(
             auth=True, user=get_user_json(current_user),
@@ -348,8 +346,7 @@ def create_handler(sess_cr: ClassVar, lm: LoginManager,
 
     @app.route(ApiRoutes.RenameUser, methods=[RequestMethods.PUT])
     @login_required
-    @limits(Limits.UserRename, LimitTypes.ip)
-    @limits(Limits.UserRename, LimitTypes.user)
+    @limits(Limits.UserRename)
     def do_change_username():
         form = ChangeUsernameForm()
 
@@ -375,13 +372,13 @@ def create_handler(sess_cr: ClassVar, lm: LoginManager,
 
         user.username = username
         session.commit()
+        user_cache.invalidate(user.id)
         return jsonify(UserResponseJson(
             auth=True, user=get_user_json(user), path=''))
 
     @app.route(ApiRoutes.ChangeEmail, methods=[RequestMethods.PUT])
     @login_required
-    @limits(Limits.ChangeEmail, LimitTypes.ip)
-    @limits(Limits.ChangeEmail, LimitTypes.user)
+    @limits(Limits.ChangeEmail)
     def do_change_email():
         """ E-mail changing handler. """
         form = ChangeEmailForm()
@@ -420,6 +417,7 @@ def create_handler(sess_cr: ClassVar, lm: LoginManager,
 
         user.email = new_email
         session.commit()
+        user_cache.invalidate(user.id)
 
         return jsonify(UserResponseJson(auth=True,
                                         user=get_user_json(user),
@@ -428,8 +426,7 @@ def create_handler(sess_cr: ClassVar, lm: LoginManager,
     @app.route(ApiRoutes.ChangePassword,
                methods=[RequestMethods.PUT])
     @login_required
-    @limits(Limits.ChangePassword, LimitTypes.ip)
-    @limits(Limits.ChangePassword, LimitTypes.user)
+    @limits(Limits.ChangePassword)
     def do_change_password():
         """ Password changing handler. """
 
@@ -456,14 +453,14 @@ def create_handler(sess_cr: ClassVar, lm: LoginManager,
         user.set_password(new_password)
 
         session.commit()
+        user_cache.invalidate(user.id)
         return jsonify(UserResponseJson(auth=True,
                                         user=get_user_json(user),
                                         path=''))
 
     @app.route(ApiRoutes.Logout, methods=[RequestMethods.POST])
     @login_required
-    @limits(Limits.Logout, LimitTypes.ip)
-    @limits(Limits.Logout, LimitTypes.user)
+    @limits(Limits.Logout)
     def logout():
         """ Handler for logging out """
 
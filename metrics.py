@@ -0,0 +1,183 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+# Prometheus metrics of the panel. Under gunicorn set
+# PROMETHEUS_MULTIPROC_DIR, every worker then writes its values
+# to files there and /metrics sums them.
+#
+# Queries and Redis commands are counted in flask.g and added to
+# the metrics once per request, so their locks are taken per request
+# and not per query.
+
+import os
+from time import perf_counter, monotonic
+
+from flask import Flask, g, has_app_context, request
+from prometheus_client import Counter, Histogram, Gauge, \
+    CollectorRegistry, REGISTRY, generate_latest, multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from redis_storage.redis_session import get_commands, get_wait, \
+    get_pool_stats
+from storage import db_session
+
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+# Seconds between pool gauge updates in a worker
+POOL_STATS_INTERVAL = 1
+
+REQUESTS = Counter('limq_panel_requests_total', 'Requests',
+                   ['route', 'method', 'status'])
+REQUEST_SECONDS = Histogram('limq_panel_request_seconds',
+                            'Request latency', ['route'])
+DB_QUERIES = Counter('limq_panel_db_queries_total',
+                     'Postgres queries', ['route'])
+DB_SECONDS = Counter('limq_panel_db_query_seconds_total',
+                     'Time spent in Postgres queries', ['route'])
+REDIS_COMMANDS = Counter('limq_panel_redis_commands_total',
+                         'Redis commands', ['route'])
+REDIS_SECONDS = Counter('limq_panel_redis_seconds_total',
+                        'Time spent waiting for Redis replies', ['route'])
+RATE_LIMITED = Counter('limq_panel_rate_limited_total',
+                       'Requests refused by rate limits', ['route'])
+DB_POOL = Gauge('limq_panel_db_pool_connections',
+                'Postgres pool connections', ['state'],
+                multiprocess_mode='livesum')
+REDIS_POOL = Gauge('limq_panel_redis_pool_connections',
+                   'Redis pool connections', ['address', 'state'],
+                   multiprocess_mode='livesum')
+
+# Set by outbox_worker.py
+OUTBOX_DRAINED = Counter('limq_outbox_drained_total',
+                         'Outbox events written to Redis')
+OUTBOX_PENDING = Gauge('limq_outbox_pending_events',
+                       'Outbox events not drained yet',
+                       multiprocess_mode='max')
+OUTBOX_LAG = Gauge('limq_outbox_lag_seconds',
+                   'Age of the oldest outbox event',
+                   multiprocess_mode='max')
+
+pool_stats_updated = 0.0
+
+
+def get_route() -> str:
+    """ Route pattern, so ids in paths don't create new series """
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def count_rate_limited():
+    RATE_LIMITED.labels(get_route()).inc()
+
+
+def observe_request(route: str, method: str, status: int,
+                    started: float):
+    REQUESTS.labels(route, method, status).inc()
+    REQUEST_SECONDS.labels(route).observe(perf_counter() - started)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters,
+                          context, executemany):
+    conn.info.setdefault('query_started', []).append(perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters,
+                         context, executemany):
+    started = conn.info['query_started'].pop()
+    if has_app_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_seconds = g.get('db_seconds', 0) + perf_counter() - started
+
+
+def handle_error(context):
+    """ Failed queries don't reach after_cursor_execute """
+    conn = context.connection
+    if conn is not None and conn.info.get('query_started'):
+        conn.info['query_started'].pop()
+
+
+def instrument_engines():
+    """ Listens on the Engine class, the engine itself is lazy """
+
+    if event.contains(Engine, 'before_cursor_execute',
+                      before_cursor_execute):
+        return
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(Engine, 'handle_error', handle_error)
+
+
+def update_pool_stats():
+    global pool_stats_updated
+    if monotonic() - pool_stats_updated < POOL_STATS_INTERVAL:
+        return
+    pool_stats_updated = monotonic()
+
+    engine = db_session.engine
+    if engine is not None:
+        DB_POOL.labels('size').set(engine.pool.size())
+        DB_POOL.labels('checked_out').set(engine.pool.checkedout())
+        DB_POOL.labels('overflow').set(max(engine.pool.overflow(), 0))
+
+    for stats in get_pool_stats():
+        REDIS_POOL.labels(stats['address'], 'max') \
+            .set(stats['max_connections'])
+        REDIS_POOL.labels(stats['address'], 'created') \
+            .set(stats['created'])
+        REDIS_POOL.labels(stats['address'], 'in_use') \
+            .set(stats['in_use'])
+
+
+def init_app(app: Flask):
+    """
+    Register before other teardown handlers: ours runs last, so the
+    commit of the request's DB session is counted too.
+    """
+
+    instrument_engines()
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = perf_counter()
+
+    @app.after_request
+    def remember_response(response):
+        # request is gone by the time app context tears down
+        g.metrics_route = get_route()
+        g.metrics_method = request.method
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_appcontext
+    def observe(exception=None):
+        if 'metrics_route' not in g:
+            return
+        route = g.metrics_route
+
+        observe_request(route, g.metrics_method, g.metrics_status,
+                        g.metrics_started)
+
+        if 'db_queries' in g:
+            DB_QUERIES.labels(route).inc(g.db_queries)
+            DB_SECONDS.labels(route).inc(g.db_seconds)
+        if get_commands():
+            REDIS_COMMANDS.labels(route).inc(get_commands())
+            REDIS_SECONDS.labels(route).inc(get_wait())
+
+        update_pool_stats()
+
+
+def get_registry() -> CollectorRegistry:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def generate() -> bytes:
+    return generate_latest(get_registry())
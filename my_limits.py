@@ -5,11 +5,37 @@
 #  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
 #  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
 
-from redis_storage.params_creator import get_redis_link
-from content_limits import init_limit
-from flask import Flask
+from os import getenv, path
 
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
 
-def limit_generator(app: Flask):
-    uri, params = get_redis_link()
-    return init_limit(app, uri, params)
+from storage.url_creator import get_int_env
+from redis_storage.redis_session import limits_init, async_limits_init
+from content_limits import init_limit, load_limits_config, \
+    AsyncCombinedLimiter, LimitsConfig
+from storage.user_type_cache import UserTypeCache
+
+LIMITS_CONFIG = getenv('limits_config') or \
+    path.join(path.dirname(path.abspath(__file__)), 'limits.json')
+
+# Refused limit windows remembered in each worker, 0 disables
+LOCAL_LIMIT_CACHE_SIZE = get_int_env('local_limit_cache_size', 4096)
+# Clients counted by each worker for routes with local limits
+LOCAL_LIMITER_SIZE = get_int_env('local_limiter_size', 10000)
+
+
+def limit_generator(user_types: UserTypeCache):
+    return init_limit(Redis(connection_pool=limits_init()),
+                      limits_config(), user_types,
+                      LOCAL_LIMIT_CACHE_SIZE, LOCAL_LIMITER_SIZE)
+
+
+def async_limiter() -> AsyncCombinedLimiter:
+    return AsyncCombinedLimiter(
+        AsyncRedis(connection_pool=async_limits_init()),
+        LOCAL_LIMIT_CACHE_SIZE)
+
+
+def limits_config() -> LimitsConfig:
+    return load_limits_config(LIMITS_CONFIG)
@@ -0,0 +1,160 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+# Drains the redis_outbox table into Redis. Handlers only insert
+# outbox events in their transactions, this worker makes Redis
+# follow Postgres. Run one or more, only one drains at a time.
+#
+#   python outbox_worker.py [--batch-size 500] [--metrics-port 9101]
+
+import argparse
+import logging
+import select
+from datetime import datetime
+from time import monotonic, sleep
+
+import psycopg2
+import psycopg2.extensions
+import sqlalchemy
+import sqlalchemy.orm as orm
+from prometheus_client import start_http_server
+from redis.exceptions import RedisError
+from sqlalchemy.exc import SQLAlchemyError
+
+import metrics
+from redis_storage.outbox import drain
+from redis_storage.redis_session import base_init as redis_base_init
+from storage.db_session import base_init
+from storage.outbox import OutboxEvent, OUTBOX_CHANNEL, \
+    OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_REPORT_INTERVAL, \
+    OUTBOX_METRICS_PORT
+from storage.url_creator import create_url
+
+FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+logging.basicConfig(format=FORMAT, level=logging.INFO)
+
+# Seconds between retries of a failed batch, doubled up to the max
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 30
+
+
+class DrainStats:
+    """
+    Drain rate and lag, logged and exported to Prometheus
+    every report_interval seconds.
+    """
+
+    def __init__(self, session_maker: orm.sessionmaker,
+                 report_interval: int = OUTBOX_REPORT_INTERVAL):
+        self.session_maker = session_maker
+        self.report_interval = report_interval
+        self.drained = 0
+        self.started = monotonic()
+
+    def count(self, drained: int):
+        self.drained += drained
+        metrics.OUTBOX_DRAINED.inc(drained)
+
+    def report(self):
+        elapsed = monotonic() - self.started
+        if elapsed < self.report_interval:
+            return
+
+        session = self.session_maker()
+        try:
+            pending, oldest = session.query(
+                sqlalchemy.func.count(OutboxEvent.id),
+                sqlalchemy.func.min(OutboxEvent.created)).one()
+        finally:
+            session.close()
+
+        lag = (datetime.now() - oldest).total_seconds() if oldest else 0
+        metrics.OUTBOX_PENDING.set(pending)
+        metrics.OUTBOX_LAG.set(lag)
+        logging.info(f'Outbox: drained {self.drained} '
+                     f'({self.drained / elapsed:.1f}/s), '
+                     f'pending {pending}, lag {lag:.1f} s')
+        self.drained = 0
+        self.started = monotonic()
+
+
+def listen() -> psycopg2.extensions.connection:
+    connection = psycopg2.connect(create_url())
+    connection.set_isolation_level(
+        psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    with connection.cursor() as cursor:
+        cursor.execute(f'LISTEN {OUTBOX_CHANNEL}')
+    return connection
+
+
+def wait_notification(connection: psycopg2.extensions.connection,
+                      timeout: float):
+    if select.select([connection], [], [], timeout) != ([], [], []):
+        connection.poll()
+        connection.notifies.clear()
+
+
+def run(batch_size: int, poll_interval: int):
+    session_maker = base_init()
+    rds = redis_base_init()
+    stats = DrainStats(session_maker)
+    listener = None
+    retry_delay = RETRY_DELAY
+
+    while True:
+        session = session_maker()
+        try:
+            drained = drain(session, rds, batch_size)
+            stats.count(drained)
+            stats.report()
+            retry_delay = RETRY_DELAY
+        except (SQLAlchemyError, RedisError) as e:
+            session.rollback()
+            logging.warning(f'Outbox batch failed: {e}. '
+                            f'Retry in {retry_delay} s')
+            sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, MAX_RETRY_DELAY)
+            continue
+        finally:
+            session.close()
+
+        if drained == batch_size:
+            continue
+
+        # Backlog is empty or another worker drains it
+        try:
+            listener = listener or listen()
+            wait_notification(listener, poll_interval)
+        except psycopg2.Error as e:
+            logging.warning(f'Outbox listener failed: {e}')
+            listener = None
+            sleep(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Drain the Redis outbox')
+    parser.add_argument('--batch-size', type=int,
+                        default=OUTBOX_BATCH_SIZE,
+                        help='events per Redis pipeline')
+    parser.add_argument('--poll-interval', type=int,
+                        default=OUTBOX_POLL_INTERVAL,
+                        help='seconds to wait for a notification')
+    parser.add_argument('--metrics-port', type=int,
+                        default=OUTBOX_METRICS_PORT,
+                        help='serve Prometheus metrics, 0 disables')
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        start_http_server(args.metrics_port,
+                          registry=metrics.get_registry())
+
+    run(args.batch_size, args.poll_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,30 +5,109 @@
 #  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
 #  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
 
-from typing import List, Iterable, ClassVar
+from os import getenv
+from typing import List, ClassVar, Iterable, Tuple
 
+import sqlalchemy
 from redis import Redis
-from queue import Queue
+from redis.client import Pipeline
 
 from storage.mixin import Mixin
+from storage.url_creator import get_int_env
 
 REDIS_KEY_KEY = 'limq_isolate_{key}'
 REDIS_CHANNEL_KEY = 'limq_channel_{channel_id}'
+REDIS_MIXINS_KEY = 'limq_mixins_{channel_id}'
 MIXINS_FIELD = 'mixins'
 
+# Mixins live in a set per channel. Until every broker reads the sets,
+# the comma-joined mixins field of the channel hash is written too
+# and is read back for channels not migrated yet.
+MIXINS_LEGACY_FIELD = getenv('redis_mixins_legacy_field', '1') == '1'
+
+# Upper bound of channels visited by the mixin loop check
+MIXIN_LOOP_MAX_CHANNELS = get_int_env('mixin_loop_max_channels', 10000)
+
+# Atomic edits of the comma-joined mixins field,
+# run by EVAL so they can be queued in a MULTI/EXEC pipeline
+ADD_MIXIN_SCRIPT = """
+local mixins = redis.call('HGET', KEYS[1], ARGV[1])
+if not mixins or mixins == '' then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    return 1
+end
+for channel_id in string.gmatch(mixins, '[^,]+') do
+    if channel_id == ARGV[2] then
+        return 0
+    end
+end
+redis.call('HSET', KEYS[1], ARGV[1], mixins .. ',' .. ARGV[2])
+return 1
+"""
+
+DELETE_MIXIN_SCRIPT = """
+local mixins = redis.call('HGET', KEYS[1], ARGV[1])
+if not mixins then
+    return 0
+end
+local kept = {}
+local found = 0
+for channel_id in string.gmatch(mixins, '[^,]+') do
+    if found == 0 and channel_id == ARGV[2] then
+        found = 1
+    else
+        table.insert(kept, channel_id)
+    end
+end
+if found == 1 then
+    redis.call('HSET', KEYS[1], ARGV[1], table.concat(kept, ','))
+end
+return found
+"""
+
+# Copies the legacy field of one channel into its set. A script,
+# so delete_mixin can't run between the read and the SADD
+MIGRATE_MIXINS_SCRIPT = """
+local mixins = redis.call('HGET', KEYS[1], ARGV[1])
+if not mixins or mixins == '' then
+    return 0
+end
+for channel_id in string.gmatch(mixins, '[^,]+') do
+    redis.call('SADD', KEYS[2], channel_id)
+end
+return 1
+"""
+
 
 class RedisKeys:
     permissions = 'permissions'
     channel_id = 'channel_id'
 
 
-class ChannelIdQueue(Queue):
-    def __init__(self):
-        super().__init__()
+class RedisBatch:
+    """
+    Unit of work for Redis mutations of a handler.
+    Functions of this module get the batch's pipeline instead of
+    a client, and everything queued is sent as one MULTI/EXEC
+    when the block exits without an error.
+    Use it after the SQL commit.
+    """
+
+    def __init__(self, sess: Redis):
+        self.pipe = sess.pipeline(transaction=True)
+
+    def __enter__(self) -> Pipeline:
+        return self.pipe
 
-    def put_several(self, items: Iterable):
-        for item in items:
-            self.put(item)
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.pipe.reset()
+
+    def flush(self):
+        if len(self.pipe):
+            self.pipe.execute()
 
 
 def get_redis_key(key: str) -> str:
@@ -43,6 +122,10 @@ def get_redis_channel(channel_id: str) -> str:
     return REDIS_CHANNEL_KEY.format(channel_id=channel_id)
 
 
+def get_redis_mixins(channel_id: str) -> str:
+    return REDIS_MIXINS_KEY.format(channel_id=channel_id)
+
+
 def set_key_permissions(sess: Redis, key: str, permissions: int):
     sess.hset(get_redis_key(key), RedisKeys.permissions,
               str(permissions))
@@ -53,6 +136,18 @@ def set_key_channel_id(sess: Redis, key: str, channel_id: str):
               channel_id)
 
 
+def set_keys(sess: Redis, keys: Iterable[Tuple[str, int, str]]):
+    """
+    Writes (key, permissions, channel_id) for many keys,
+    pass a RedisBatch pipeline to send them at once.
+    """
+
+    for key, permissions, channel_id in keys:
+        sess.hset(get_redis_key(key), mapping={
+            RedisKeys.permissions: str(permissions),
+            RedisKeys.channel_id: channel_id})
+
+
 def delete_key(sess: Redis, key: str):
     sess.delete(REDIS_KEY_KEY.format(key=key))
 
@@ -66,65 +161,120 @@ def generate_mixins(redis_mixins: str) -> List[str]:
 
 
 def set_mixins(sess: Redis, src_channel_id: str, mixins: List[str]):
-    str_mixins = generate_redis_mixins(mixins)
-    sess.hset(
-        get_redis_channel(src_channel_id), MIXINS_FIELD, str_mixins)
+    sess.delete(get_redis_mixins(src_channel_id))
+    if mixins:
+        sess.sadd(get_redis_mixins(src_channel_id), *mixins)
 
+    if MIXINS_LEGACY_FIELD:
+        str_mixins = generate_redis_mixins(mixins)
+        sess.hset(
+            get_redis_channel(src_channel_id), MIXINS_FIELD, str_mixins)
 
-def get_mixins(sess: Redis, src_channel_id: str) -> List[str]:
+
+def decode(value: bytes or str) -> str:
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def get_legacy_mixins(sess: Redis, src_channel_id: str) -> List[str]:
     redis_mixins = sess.hget(
         get_redis_channel(src_channel_id), MIXINS_FIELD
     )
 
-    if not redis_mixins:
-        redis_mixins = ''
+    return generate_mixins(decode(redis_mixins or ''))
 
-    if isinstance(redis_mixins, bytes):
-        redis_mixins = redis_mixins.decode('utf-8')
 
-    return generate_mixins(redis_mixins)
+def get_mixins(sess: Redis, src_channel_id: str) -> List[str]:
+    mixins = [decode(channel_id) for channel_id in
+              sess.smembers(get_redis_mixins(src_channel_id))]
+
+    if not mixins and MIXINS_LEGACY_FIELD:
+        return get_legacy_mixins(sess, src_channel_id)
+    return mixins
 
 
 def add_mixin(sess: Redis,
               src_channel_id: str, dest_channel_id: str):
-    mixins = get_mixins(sess, src_channel_id)
-    mixins.append(dest_channel_id)
-    set_mixins(sess, src_channel_id, mixins)
+    sess.sadd(get_redis_mixins(src_channel_id), dest_channel_id)
+
+    if MIXINS_LEGACY_FIELD:
+        sess.eval(ADD_MIXIN_SCRIPT, 1,
+                  get_redis_channel(src_channel_id),
+                  MIXINS_FIELD, dest_channel_id)
 
 
 def delete_mixin(sess: Redis, source_channel_id: str,
                  dest_channel_id: str):
-    mixins = get_mixins(sess, source_channel_id)
-    if dest_channel_id in mixins:
-        mixins.remove(dest_channel_id)
-        set_mixins(sess, source_channel_id, mixins)
+    # Legacy field first: migrate_mixins must not find the link
+    # there after it left the set
+    if MIXINS_LEGACY_FIELD:
+        sess.eval(DELETE_MIXIN_SCRIPT, 1,
+                  get_redis_channel(source_channel_id),
+                  MIXINS_FIELD, dest_channel_id)
+
+    sess.srem(get_redis_mixins(source_channel_id), dest_channel_id)
+
+
+def migrate_mixins(sess: Redis, batch_size: int = 1000) -> int:
+    """
+    Copies legacy mixins fields into the mixin sets.
+    Safe to repeat and to run while the panel is serving:
+    every channel is copied by one script, and writers change
+    the legacy field before the set (set_mixins in MULTI/EXEC).
+    Returns the number of channels with mixins.
+    """
+
+    migrated = 0
+    channel_keys = []
+    migrate = sess.register_script(MIGRATE_MIXINS_SCRIPT)
+    prefix_length = len(REDIS_CHANNEL_KEY.format(channel_id=''))
+
+    def flush():
+        nonlocal migrated
+        pipe = sess.pipeline(transaction=False)
+        for channel_key in channel_keys:
+            channel_id = decode(channel_key)[prefix_length:]
+            migrate(keys=[channel_key, get_redis_mixins(channel_id)],
+                    args=[MIXINS_FIELD], client=pipe)
+        migrated += sum(pipe.execute())
+        channel_keys.clear()
+
+    for key in sess.scan_iter(
+            match=REDIS_CHANNEL_KEY.format(channel_id='*'),
+            count=batch_size):
+        channel_keys.append(key)
+        if len(channel_keys) >= batch_size:
+            flush()
+    flush()
+    return migrated
 
 
 def mixin_not_create_loop(db_sess: ClassVar, source_id: str,
-                          dest_id: str
+                          dest_id: str,
+                          max_channels: int = MIXIN_LOOP_MAX_CHANNELS
                           ) -> bool:
-    def get_dest_ids(mixins: Iterable[Mixin]) -> List[str]:
-        return [mixin.dest_channel for mixin in mixins]
+    """
+    Walks channels reachable from dest_id with one recursive CTE.
+    UNION keeps every channel once, so the walk ends on any topology.
+    If more than max_channels are reachable the mixin is refused.
+    """
 
-    mixins_out_dest = db_sess.query(Mixin).filter(
-        Mixin.source_channel == dest_id).all()
+    reachable = db_sess.query(
+        Mixin.dest_channel.label('channel_id')).filter(
+        Mixin.source_channel == dest_id).cte('reachable', recursive=True)
 
-    if not mixins_out_dest:
-        return True
-    queue = ChannelIdQueue()
-    queue.put_several(get_dest_ids(mixins_out_dest))
+    reachable = reachable.union(
+        db_sess.query(Mixin.dest_channel).join(
+            reachable, Mixin.source_channel == reachable.c.channel_id))
 
-    while not queue.empty():
-        next_id = queue.get()
-        if next_id == source_id:
-            return False
+    visited = db_sess.query(reachable.c.channel_id) \
+        .limit(max_channels + 1).subquery()
 
-        mixins_out = db_sess.query(Mixin).filter(
-            Mixin.source_channel == next_id).all()
+    visited_count, loop_count = db_sess.query(
+        sqlalchemy.func.count(),
+        sqlalchemy.func.count().filter(
+            visited.c.channel_id == source_id)).one()
 
-        if mixins_out:
-            queue.put_several(get_dest_ids(mixins_out))
-    return True
+    return not loop_count and visited_count <= max_channels
 
 
 def convert_value(v):
@@ -141,10 +291,23 @@ def convert_dict_to_redis(d: dict) -> dict:
     return converted_dict
 
 
+def set_channel(sess: Redis, channel_id: str, data: dict,
+                mixins: List[str]):
+    sess.hset(get_redis_channel(channel_id),
+              mapping=convert_dict_to_redis(data))
+    set_mixins(sess, channel_id, mixins)
+
+
+def delete_channel(sess: Redis, channel_id: str):
+    sess.delete(get_redis_channel(channel_id),
+                get_redis_mixins(channel_id))
+
+
 def add_channel(sess: Redis,
                 channel_id: str,
                 data: dict):
-    data['mixins'] = ''
+    if MIXINS_LEGACY_FIELD:
+        data[MIXINS_FIELD] = ''
 
     sess.hset(REDIS_CHANNEL_KEY.format(channel_id=channel_id),
               mapping=convert_dict_to_redis(data))
@@ -0,0 +1,102 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+from typing import Dict, List, Set
+
+import sqlalchemy
+import sqlalchemy.orm as orm
+from redis import Redis
+from redis.client import Pipeline
+
+import redis_storage
+from storage.channel import Channel
+from storage.key import Key
+from storage.mixin import Mixin
+from storage.outbox import OutboxEvent, OutboxEntities
+
+# Held by the worker draining the outbox, see drain()
+OUTBOX_LOCK_ID = 0x4c694d51
+
+
+def get_channel_data(channel: Channel) -> dict:
+    data = {column.name: getattr(channel, column.name)
+            for column in Channel.__table__.columns}
+    return {k: v for k, v in data.items() if v is not None}
+
+
+def get_entity_ids(events: List[OutboxEvent], entity: str) -> Set[str]:
+    return {event.entity_id for event in events if event.entity == entity}
+
+
+def sync_keys(session: orm.Session, pipe: Pipeline, key_ids: Set[str]):
+    keys = session.query(Key.key, Key.perm, Key.chan_id) \
+        .filter(Key.key.in_(key_ids)).all()
+    redis_storage.set_keys(pipe, keys)
+
+    for key in key_ids - {key.key for key in keys}:
+        redis_storage.delete_key(pipe, key)
+
+
+def sync_channels(session: orm.Session, pipe: Pipeline,
+                  channel_ids: Set[str]):
+    channels = session.query(Channel) \
+        .filter(Channel.id.in_(channel_ids)).all()
+
+    mixins: Dict[str, List[str]] = {channel_id: []
+                                    for channel_id in channel_ids}
+    rows = session.query(Mixin.source_channel, Mixin.dest_channel) \
+        .filter(Mixin.source_channel.in_(channel_ids)) \
+        .order_by(Mixin.id)
+    for source_channel, dest_channel in rows:
+        mixins[source_channel].append(dest_channel)
+
+    for channel in channels:
+        redis_storage.set_channel(pipe, channel.id,
+                                  get_channel_data(channel),
+                                  mixins[channel.id])
+
+    for channel_id in channel_ids - {channel.id for channel in channels}:
+        redis_storage.delete_channel(pipe, channel_id)
+
+
+def drain(session: orm.Session, rds: Redis, batch_size: int) -> int:
+    """
+    Writes the current state of entities from the oldest events
+    to Redis in one MULTI/EXEC, then deletes the events.
+    Events carry no data, so applying a batch twice or out of order
+    still ends with Redis matching Postgres. Only one worker drains
+    at a time, otherwise an older read could overwrite a newer one.
+    Returns the number of drained events.
+    """
+
+    locked = session.execute(
+        sqlalchemy.select(sqlalchemy.func.pg_try_advisory_xact_lock(
+            OUTBOX_LOCK_ID))).scalar()
+    if not locked:
+        session.rollback()
+        return 0
+
+    events = session.query(OutboxEvent).order_by(OutboxEvent.id) \
+        .limit(batch_size).with_for_update(skip_locked=True).all()
+    if not events:
+        session.rollback()
+        return 0
+
+    key_ids = get_entity_ids(events, OutboxEntities.key)
+    channel_ids = get_entity_ids(events, OutboxEntities.channel)
+
+    with redis_storage.RedisBatch(rds) as pipe:
+        if key_ids:
+            sync_keys(session, pipe, key_ids)
+        if channel_ids:
+            sync_channels(session, pipe, channel_ids)
+
+    session.query(OutboxEvent) \
+        .filter(OutboxEvent.id.in_([event.id for event in events])) \
+        .delete(synchronize_session=False)
+    session.commit()
+    return len(events)
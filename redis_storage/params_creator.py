@@ -8,6 +8,8 @@
 from typing import TypedDict
 from os import getenv
 
+from storage.url_creator import get_int_env
+
 
 class Params(TypedDict):
     host: str
@@ -44,6 +46,32 @@ def get_limits_params() -> Params:
     return Params(host=host, port=port, db=db, password=password)
 
 
+class PoolParams(TypedDict):
+    max_connections: int
+    timeout: int
+    health_check_interval: int
+    socket_keepalive: bool
+    unix_socket_path: str
+
+
+def read_pool_params(prefix: str) -> PoolParams:
+    return PoolParams(
+        max_connections=get_int_env(f'{prefix}_max_connections', 50),
+        timeout=get_int_env(f'{prefix}_pool_timeout', 5),
+        health_check_interval=get_int_env(
+            f'{prefix}_health_check_interval', 30),
+        socket_keepalive=getenv(f'{prefix}_socket_keepalive', '1') == '1',
+        unix_socket_path=getenv(f'{prefix}_unix_socket') or '')
+
+
+def get_pool_params() -> PoolParams:
+    return read_pool_params('redis')
+
+
+def get_limits_pool_params() -> PoolParams:
+    return read_pool_params('redis_limit')
+
+
 redis_uri = str
 
 
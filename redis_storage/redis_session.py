@@ -5,12 +5,247 @@
 #  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
 #  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
 
+from collections import Counter, defaultdict
+from os import getpid
+from time import perf_counter
+from typing import Dict, List, TypedDict
+
 import redis
-from .params_creator import get_params
+import redis.asyncio
+from flask import g, has_app_context
+
+from .params_creator import get_params, get_limits_params, \
+    get_pool_params, get_limits_pool_params, Params, PoolParams
 
 params = get_params()
 
+# Pools by server address and db, shared by clients pointing to
+# the same Redis database
+pools: Dict[tuple, redis.BlockingConnectionPool] = {}
+async_pools: Dict[tuple, redis.asyncio.BlockingConnectionPool] = {}
+
+# Open and checked out connections by server address and db
+connection_counts: Dict[str, Counter] = defaultdict(Counter)
+
+
+class PoolStats(TypedDict):
+    address: str
+    max_connections: int
+    created: int
+    in_use: int
+
+
+def count_commands(count: int):
+    if has_app_context():
+        g.redis_commands = g.get('redis_commands', 0) + count
+
+
+def count_wait(seconds: float):
+    if has_app_context():
+        g.redis_seconds = g.get('redis_seconds', 0) + seconds
+
+
+def get_commands() -> int:
+    return g.get('redis_commands', 0)
+
+
+def get_wait() -> float:
+    """ Seconds spent waiting for Redis replies """
+    return g.get('redis_seconds', 0)
+
+
+class CommandCounter:
+    """
+    Connection mixin counting commands and time spent waiting
+    for replies during the current request, and open and checked out
+    connections of its address for get_pool_stats.
+    """
+
+    sent_at = None
+    # Process which counted the connection, a forked worker
+    # must not uncount connections of its parent
+    counted_by = None
+    checked_out_by = None
+
+    @property
+    def address(self) -> str:
+        return f"redis://{self.host}:{self.port}/{self.db}"
+
+    def connect(self):
+        super().connect()
+        if self.counted_by is None:
+            self.counted_by = getpid()
+            connection_counts[self.address]['created'] += 1
+
+    def disconnect(self, *args, **kwargs):
+        if self.counted_by == getpid():
+            connection_counts[self.address]['created'] -= 1
+        self.counted_by = None
+        return super().disconnect(*args, **kwargs)
+
+    def check_out(self):
+        self.checked_out_by = getpid()
+        connection_counts[self.address]['in_use'] += 1
+
+    def check_in(self):
+        if self.checked_out_by == getpid():
+            connection_counts[self.address]['in_use'] -= 1
+        self.checked_out_by = None
+
+    def send_command(self, *args, **kwargs):
+        count_commands(1)
+        return super().send_command(*args, **kwargs)
+
+    def pack_commands(self, commands):
+        commands = list(commands)
+        count_commands(len(commands))
+        return super().pack_commands(commands)
+
+    def send_packed_command(self, command, check_health=True):
+        self.sent_at = perf_counter()
+        return super().send_packed_command(command, check_health)
+
+    def read_response(self, *args, **kwargs):
+        response = super().read_response(*args, **kwargs)
+        if self.sent_at is not None:
+            now = perf_counter()
+            count_wait(now - self.sent_at)
+            # Next reply of a pipeline counts from here
+            self.sent_at = now
+        return response
+
+
+class CountingConnection(CommandCounter, redis.Connection):
+    ...
+
+
+class CountingUnixConnection(CommandCounter,
+                             redis.UnixDomainSocketConnection):
+
+    @property
+    def address(self) -> str:
+        return f"unix://{self.path}?db={self.db}"
+
+
+class CountingPool(redis.BlockingConnectionPool):
+    """ Tells CommandCounter connections when they leave and return """
+
+    def get_connection(self, *args, **kwargs):
+        connection = super().get_connection(*args, **kwargs)
+        connection.check_out()
+        return connection
+
+    def release(self, connection):
+        connection.check_in()
+        super().release(connection)
+
+
+def get_address(redis_params: Params, pool_params: PoolParams) -> str:
+    if pool_params['unix_socket_path']:
+        return f"unix://{pool_params['unix_socket_path']}" \
+               f"?db={redis_params['db']}"
+    return f"redis://{redis_params['host']}:{redis_params['port']}" \
+           f"/{redis_params['db']}"
+
+
+def get_connection_params(redis_params: Params,
+                          pool_params: PoolParams) -> dict:
+    connection_params = dict(
+        db=redis_params['db'],
+        password=redis_params['password'],
+        max_connections=pool_params['max_connections'],
+        timeout=pool_params['timeout'],
+        health_check_interval=pool_params['health_check_interval'])
+
+    if pool_params['unix_socket_path']:
+        connection_params.update(path=pool_params['unix_socket_path'])
+    else:
+        connection_params.update(
+            host=redis_params['host'],
+            port=redis_params['port'],
+            socket_keepalive=pool_params['socket_keepalive'])
+    return connection_params
+
+
+def create_pool(redis_params: Params, pool_params: PoolParams
+                ) -> CountingPool:
+    """
+    Blocking pool: when max_connections are busy a caller waits
+    up to timeout seconds instead of opening one more socket.
+    """
+
+    pool_key = (get_address(redis_params, pool_params),
+                redis_params['password'])
+    if pool_key in pools:
+        return pools[pool_key]
+
+    connection_class = CountingUnixConnection \
+        if pool_params['unix_socket_path'] else CountingConnection
+    pool = CountingPool(
+        connection_class=connection_class,
+        **get_connection_params(redis_params, pool_params))
+
+    pools[pool_key] = pool
+    return pool
+
+
+def create_async_pool(redis_params: Params, pool_params: PoolParams
+                      ) -> redis.asyncio.BlockingConnectionPool:
+    """ Same as create_pool for redis.asyncio clients of asgi.py """
+
+    pool_key = (get_address(redis_params, pool_params),
+                redis_params['password'])
+    if pool_key in async_pools:
+        return async_pools[pool_key]
+
+    connection_class = redis.asyncio.UnixDomainSocketConnection \
+        if pool_params['unix_socket_path'] else redis.asyncio.Connection
+    pool = redis.asyncio.BlockingConnectionPool(
+        connection_class=connection_class,
+        **get_connection_params(redis_params, pool_params))
+
+    async_pools[pool_key] = pool
+    return pool
+
+
+def get_pool_stats() -> List[PoolStats]:
+    stats = []
+    for (address, _), pool in pools.items():
+        counts = connection_counts[address]
+        stats.append(PoolStats(
+            address=address,
+            max_connections=pool.max_connections,
+            created=counts['created'],
+            in_use=counts['in_use']))
+    return stats
+
 
 def base_init():
-    session = redis.Redis(**params)
+    pool = create_pool(params, get_pool_params())
+    session = redis.Redis(connection_pool=pool)
     return session
+
+
+def limits_init() -> redis.BlockingConnectionPool:
+    return create_pool(get_limits_params(), get_limits_pool_params())
+
+
+def async_base_init() -> redis.asyncio.Redis:
+    return redis.asyncio.Redis(
+        connection_pool=create_async_pool(params, get_pool_params()))
+
+
+def async_limits_init() -> redis.asyncio.BlockingConnectionPool:
+    return create_async_pool(get_limits_params(),
+                             get_limits_pool_params())
+
+
+def reset_pools():
+    """
+    Forgets connections inherited from the parent process,
+    call in a forked worker before it uses Redis.
+    """
+
+    for pool in pools.values():
+        pool.reset()
+    connection_counts.clear()
@@ -0,0 +1,192 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Awaitable, Callable
+
+from flask_login import UserMixin
+from redis import Redis
+
+from storage.url_creator import get_int_env
+from storage.user import User
+
+REDIS_USER_KEY = 'limq_panel_user_{user_id}'
+REDIS_USER_VERSION_KEY = 'limq_panel_user_version_{user_id}'
+
+# Seconds a user is kept in Redis
+USER_CACHE_TTL = get_int_env('user_cache_ttl', 300)
+# Users kept in the worker's memory and seconds they're trusted there
+LOCAL_USER_CACHE_SIZE = get_int_env('local_user_cache_size', 1024)
+LOCAL_USER_CACHE_TTL = get_int_env('local_user_cache_ttl', 5)
+
+# Writes a loaded user unless invalidate() bumped the version
+# after the loader read it, so a load racing an update
+# can't put the old row back
+SET_USER_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+class CachedUser(UserMixin):
+    """
+    Detached user descriptor for flask-login's current_user.
+    Has no password data and no DB session.
+    """
+
+    def __init__(self, id: str, username: str, email: str,
+                 user_type: int):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.user_type = user_type
+
+    @classmethod
+    def from_user(cls, user: User) -> 'CachedUser':
+        return cls(user.id, user.username, user.email, user.user_type)
+
+    @classmethod
+    def from_redis(cls, data: dict) -> 'CachedUser':
+        data = {k.decode('utf-8'): v.decode('utf-8')
+                for k, v in data.items()}
+        return cls(data['id'], data['username'], data['email'],
+                   int(data['user_type']))
+
+    def to_redis(self) -> dict:
+        return {'id': self.id,
+                'username': self.username or '',
+                'email': self.email or '',
+                'user_type': self.user_type}
+
+
+def get_redis_user(user_id: str) -> str:
+    return REDIS_USER_KEY.format(user_id=user_id)
+
+
+def get_redis_user_version(user_id: str) -> str:
+    return REDIS_USER_VERSION_KEY.format(user_id=user_id)
+
+
+class UserCache:
+    """
+    Users shared by all workers through Redis,
+    with a small LRU in front of it in every worker.
+    """
+
+    def __init__(self, sess: Redis,
+                 size: int = LOCAL_USER_CACHE_SIZE,
+                 local_ttl: int = LOCAL_USER_CACHE_TTL,
+                 ttl: int = USER_CACHE_TTL):
+        self.sess = sess
+        self.size = size
+        self.local_ttl = local_ttl
+        self.ttl = ttl
+        self.lock = Lock()
+        self.local: OrderedDict = OrderedDict()
+        self.set_user = sess.register_script(SET_USER_SCRIPT)
+
+    def get_local(self, user_id: str) -> CachedUser or None:
+        with self.lock:
+            cached = self.local.get(user_id)
+            if cached is None:
+                return
+            expires, user = cached
+            if expires < monotonic():
+                del self.local[user_id]
+                return
+            self.local.move_to_end(user_id)
+            return user
+
+    def set_local(self, user: CachedUser):
+        with self.lock:
+            self.local[user.id] = (monotonic() + self.local_ttl, user)
+            self.local.move_to_end(user.id)
+            while len(self.local) > self.size:
+                self.local.popitem(last=False)
+
+    def read(self, user_id: str):
+        pipe = self.sess.pipeline(transaction=False)
+        pipe.hgetall(get_redis_user(user_id))
+        pipe.get(get_redis_user_version(user_id))
+        return pipe.execute()
+
+    def write(self, user: CachedUser, version: bytes or None):
+        fields = [item for field in user.to_redis().items()
+                  for item in field]
+        return self.set_user(keys=[get_redis_user(user.id),
+                                   get_redis_user_version(user.id)],
+                             args=[version or b'0', self.ttl, *fields])
+
+    def get(self, user_id: str,
+            load: Callable[[str], User or None]) -> CachedUser or None:
+        user = self.get_local(user_id)
+        if user is not None:
+            return user
+
+        data, version = self.read(user_id)
+
+        if data:
+            user = CachedUser.from_redis(data)
+        else:
+            # The version is read before the row
+            db_user = load(user_id)
+            if db_user is None:
+                return
+            user = CachedUser.from_user(db_user)
+            self.write(user, version)
+
+        self.set_local(user)
+        return user
+
+    def invalidate(self, user_id: str):
+        """
+        Call after the commit.
+        Other workers may serve their local copy for local_ttl more.
+        """
+
+        with self.lock:
+            self.local.pop(user_id, None)
+        pipe = self.sess.pipeline()
+        pipe.incr(get_redis_user_version(user_id))
+        # Outlives any load that could have read the old version
+        pipe.expire(get_redis_user_version(user_id), self.ttl)
+        pipe.delete(get_redis_user(user_id))
+        return pipe.execute()
+
+
+class AsyncUserCache(UserCache):
+    """
+    UserCache on a redis.asyncio client, for asgi.py.
+    Its read, write and invalidate return awaitables.
+    """
+
+    async def get(self, user_id: str,
+                  load: Callable[[str], Awaitable[User or None]]
+                  ) -> CachedUser or None:
+        user = self.get_local(user_id)
+        if user is not None:
+            return user
+
+        data, version = await self.read(user_id)
+
+        if data:
+            user = CachedUser.from_redis(data)
+        else:
+            db_user = await load(user_id)
+            if db_user is None:
+                return
+            user = CachedUser.from_user(db_user)
+            await self.write(user, version)
+
+        self.set_local(user)
+        return user
@@ -0,0 +1,244 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+# Rebuilds broker state in Redis (limq_isolate_* and limq_channel_*)
+# from PostgreSQL. Rows are streamed with server-side cursors and
+# written in batches, so memory doesn't depend on the table sizes.
+# Redis entries without a row, e.g. keys revoked while Redis was
+# failing, are found by SCAN and deleted.
+#
+#   python resync.py [--dry-run] [--batch-size 1000]
+
+import argparse
+import logging
+from itertools import groupby, islice
+from time import perf_counter
+from typing import Iterable, Iterator, List, Tuple
+
+import sqlalchemy
+from redis import Redis
+
+import redis_storage
+from redis_storage.redis_session import base_init as redis_base_init
+from storage.channel import Channel
+from storage.db_session import base_init
+from storage.key import Key
+from storage.mixin import Mixin
+
+FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+logging.basicConfig(format=FORMAT, level=logging.INFO)
+
+CHANNEL_COLUMNS = [column.name for column in Channel.__table__.columns]
+
+# Redis entries and the column holding the id of their row
+REDIS_ENTRIES = (
+    ('Key hashes', redis_storage.REDIS_KEY_KEY, Key.key),
+    ('Channel hashes', redis_storage.REDIS_CHANNEL_KEY, Channel.id),
+    ('Mixin sets', redis_storage.REDIS_MIXINS_KEY, Channel.id),
+)
+
+
+class ResyncStats:
+    """ Counters of one resynced entity """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.missing = 0
+        self.changed = 0
+        self.started = perf_counter()
+
+    def report(self, dry_run: bool):
+        elapsed = perf_counter() - self.started
+        rate = self.rows / elapsed if elapsed else 0
+        message = f'{self.name}: {self.rows} in {elapsed:.1f} s ' \
+                  f'({rate:.0f}/s)'
+        if dry_run:
+            message += f', missing {self.missing}, ' \
+                       f'changed {self.changed}'
+        logging.info(message)
+
+
+def batches(rows: Iterable, size: int) -> Iterator[list]:
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def decode_hash(data: dict) -> dict:
+    return {k.decode('utf-8'): v.decode('utf-8') for k, v in data.items()}
+
+
+def get_channel_hash(row) -> dict:
+    data = {column: row._mapping[column] for column in CHANNEL_COLUMNS
+            if row._mapping[column] is not None}
+    return redis_storage.convert_dict_to_redis(data)
+
+
+def stream_channels(session, batch_size: int
+                    ) -> Iterator[Tuple[dict, List[str]]]:
+    """
+    Channels with their mixin destinations,
+    one joined query ordered by channel id.
+    """
+
+    rows = session.query(Channel.__table__, Mixin.dest_channel) \
+        .outerjoin(Mixin, Mixin.source_channel == Channel.id) \
+        .order_by(Channel.id).yield_per(batch_size)
+
+    for _, channel_rows in groupby(rows, key=lambda row: row.id):
+        channel_rows = list(channel_rows)
+        mixins = [row.dest_channel for row in channel_rows
+                  if row.dest_channel is not None]
+        yield get_channel_hash(channel_rows[0]), mixins
+
+
+def channel_differs(data: dict, mixins: List[str], current: dict,
+                    current_mixins: set) -> bool:
+    current = decode_hash(current)
+    legacy_mixins = current.pop(redis_storage.MIXINS_FIELD, None)
+
+    if current != {k: str(v) for k, v in data.items()}:
+        return True
+    if {m.decode('utf-8') for m in current_mixins} != set(mixins):
+        return True
+    if not redis_storage.MIXINS_LEGACY_FIELD:
+        return legacy_mixins is not None
+    return legacy_mixins is None or \
+        set(redis_storage.generate_mixins(legacy_mixins)) != set(mixins)
+
+
+def diff_channels(rds: Redis, batch: list, stats: ResyncStats):
+    pipe = rds.pipeline(transaction=False)
+    for data, _ in batch:
+        pipe.hgetall(redis_storage.get_redis_channel(data['id']))
+        pipe.smembers(redis_storage.get_redis_mixins(data['id']))
+    replies = pipe.execute()
+
+    for (data, mixins), current, current_mixins in zip(
+            batch, replies[::2], replies[1::2]):
+        if not current:
+            stats.missing += 1
+        elif channel_differs(data, mixins, current, current_mixins):
+            stats.changed += 1
+
+
+def write_channels(rds: Redis, batch: list):
+    """ Hashes are replaced, so fields gone from the row go too """
+
+    with redis_storage.RedisBatch(rds) as pipe:
+        for data, mixins in batch:
+            pipe.delete(redis_storage.get_redis_channel(data['id']))
+            pipe.hset(redis_storage.get_redis_channel(data['id']),
+                      mapping=data)
+            redis_storage.set_mixins(pipe, data['id'], mixins)
+
+
+def diff_keys(rds: Redis, batch: list, stats: ResyncStats):
+    pipe = rds.pipeline(transaction=False)
+    for key, _, _ in batch:
+        pipe.hgetall(redis_storage.get_redis_key(key))
+
+    for (key, perm, chan_id), current in zip(batch, pipe.execute()):
+        expected = {redis_storage.RedisKeys.permissions: str(perm),
+                    redis_storage.RedisKeys.channel_id: chan_id}
+        if not current:
+            stats.missing += 1
+        elif decode_hash(current) != expected:
+            stats.changed += 1
+
+
+def write_keys(rds: Redis, batch: list):
+    with redis_storage.RedisBatch(rds) as pipe:
+        redis_storage.set_keys(pipe, batch)
+
+
+def get_prefix(template: str) -> str:
+    return template.split('{', 1)[0]
+
+
+def find_orphans(session, rds: Redis, template: str,
+                 column: sqlalchemy.Column, batch_size: int
+                 ) -> Iterator[Tuple[int, List[bytes]]]:
+    """
+    Scanned count and entries without a row, batch by batch.
+    Redis is written after the commit, so a new entry
+    always has its row when it's found.
+    """
+
+    prefix = get_prefix(template)
+    for batch in batches(rds.scan_iter(match=f'{prefix}*',
+                                       count=batch_size), batch_size):
+        ids = [key.decode('utf-8')[len(prefix):] for key in batch]
+        existing = {row[0] for row in
+                    session.query(column).filter(column.in_(ids))}
+        yield len(batch), [key for key, entity_id in zip(batch, ids)
+                           if entity_id not in existing]
+
+
+def remove_orphans(session, rds: Redis, dry_run: bool, batch_size: int):
+    for name, template, column in REDIS_ENTRIES:
+        scanned = orphaned = 0
+        for count, orphans in find_orphans(session, rds, template,
+                                           column, batch_size):
+            scanned += count
+            orphaned += len(orphans)
+            if dry_run:
+                for key in orphans:
+                    logging.info(f'Orphaned {key.decode("utf-8")}')
+            elif orphans:
+                rds.delete(*orphans)
+
+        action = 'found' if dry_run else 'deleted'
+        logging.info(f'{name}: {orphaned} of {scanned} without a row '
+                     f'in PostgreSQL {action}')
+
+
+def resync(dry_run: bool, batch_size: int):
+    session = base_init()()
+    rds = redis_base_init()
+
+    channels = ResyncStats('Channels')
+    for batch in batches(stream_channels(session, batch_size),
+                         batch_size):
+        channels.rows += len(batch)
+        if dry_run:
+            diff_channels(rds, batch, channels)
+        else:
+            write_channels(rds, batch)
+    channels.report(dry_run)
+
+    keys = ResyncStats('Keys')
+    rows = session.query(Key.key, Key.perm, Key.chan_id) \
+        .yield_per(batch_size)
+    for batch in batches((tuple(row) for row in rows), batch_size):
+        keys.rows += len(batch)
+        if dry_run:
+            diff_keys(rds, batch, keys)
+        else:
+            write_keys(rds, batch)
+    keys.report(dry_run)
+
+    remove_orphans(session, rds, dry_run, batch_size)
+    session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Rebuild broker state in Redis from PostgreSQL')
+    parser.add_argument('--dry-run', action='store_true',
+                        help="count missing, changed and orphaned "
+                             "entries, don't write")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='rows per DB fetch and Redis pipeline')
+    args = parser.parse_args()
+
+    resync(args.dry_run, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+# Helpers of the benchmarks in this package. Run them from the
+# repository root, e.g.
+#
+#   python -m scripts.bench_mixin_loop
+
+from statistics import quantiles
+from time import perf_counter
+from typing import Callable, List
+
+import sqlalchemy
+import sqlalchemy.orm as orm
+
+from storage.db_session import ModelBase
+
+
+def create_session(url: str or None) -> orm.Session:
+    """
+    Empty schema in SQLite memory, or in the database at url.
+    Tables there are dropped first, give it a scratch database.
+    """
+
+    engine = sqlalchemy.create_engine(url or 'sqlite://')
+    ModelBase.metadata.drop_all(engine)
+    ModelBase.metadata.create_all(engine)
+    return orm.sessionmaker(bind=engine)()
+
+
+def timed(func: Callable, repeat: int) -> List[float]:
+    """ Milliseconds of each call """
+
+    samples = []
+    for _ in range(repeat):
+        started = perf_counter()
+        func()
+        samples.append((perf_counter() - started) * 1000)
+    return samples
+
+
+def report(name: str, samples: List[float]):
+    if len(samples) > 1:
+        p50, p99 = (quantiles(samples, n=100)[i] for i in (49, 98))
+    else:
+        p50 = p99 = samples[0]
+    print(f'{name:<44} p50 {p50:9.2f} ms   p99 {p99:9.2f} ms   '
+          f'n={len(samples)}')
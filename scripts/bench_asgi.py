@@ -0,0 +1,96 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+# Load on the polling routes, get_channels and get_keys, of the gevent
+# deployment and asgi.py side by side. Start both with the same number
+# of workers on the same Postgres and Redis, e.g.
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#   uvicorn asgi:application --port 8000 --workers 4
+#
+# then log in, copy the session cookie and one of your channel ids:
+#
+#   python -m scripts.bench_asgi --cookie <session> --channel <id> \
+#       http://localhost:5000 http://localhost:8000
+#
+# Point limits_config of both at a config with counts above the load,
+# otherwise most requests get 429.
+
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse
+from collections import Counter
+from http.client import HTTPConnection
+from time import perf_counter
+from urllib.parse import urlsplit
+
+import gevent
+
+from handlers import ApiRoutes
+
+from .bench import report
+
+
+def client_loop(url: str, paths: list, cookie: str, until: float,
+                samples: list, statuses: Counter):
+    address = urlsplit(url)
+    connection = HTTPConnection(address.hostname, address.port)
+    headers = {'Cookie': f'session={cookie}'}
+
+    i = 0
+    while perf_counter() < until:
+        started = perf_counter()
+        connection.request('GET', paths[i % len(paths)], headers=headers)
+        response = connection.getresponse()
+        response.read()
+        samples.append((perf_counter() - started) * 1000)
+        statuses[response.status] += 1
+        i += 1
+    connection.close()
+
+
+def load(url: str, paths: list, cookie: str, clients: int,
+         seconds: float) -> (list, Counter):
+    until = perf_counter() + seconds
+    samples, statuses = [], Counter()
+    gevent.joinall([gevent.spawn(client_loop, url, paths, cookie, until,
+                                 samples, statuses)
+                    for _ in range(clients)])
+    return samples, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark polling routes of two deployments')
+    parser.add_argument('urls', nargs='+')
+    parser.add_argument('--cookie', required=True,
+                        help='session cookie of a logged in user')
+    parser.add_argument('--channel', required=True,
+                        help='id of a channel of that user')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    paths = [ApiRoutes.GetChannels,
+             f'{ApiRoutes.GetKeys}?channel_id={args.channel}']
+
+    print(f'{args.clients} clients, {args.seconds} s each')
+    for url in args.urls:
+        # Warm up pools and caches
+        load(url, paths, args.cookie, args.clients, 1)
+        samples, statuses = load(url, paths, args.cookie, args.clients,
+                                 args.seconds)
+        report(url, samples)
+        print(f'{"":<44} {len(samples) / args.seconds:.0f} req/s   '
+              f'statuses {dict(statuses)}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+# Startup cost of the panel: cumulative import time of core measured
+# by python -X importtime, and the time create_app() takes after it.
+# Each sample runs in a fresh interpreter, so nothing is cached in
+# sys.modules. No Postgres or Redis is needed.
+#
+#   python -m scripts.bench_import [--repeat 10] [--top 10]
+
+import argparse
+import subprocess
+import sys
+from typing import List, Tuple
+
+from .bench import report
+
+CREATE_APP = """
+from time import perf_counter
+import core
+started = perf_counter()
+core.create_app()
+print((perf_counter() - started) * 1000)
+"""
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, str, int]]:
+    """ (depth, module, cumulative us) of every import """
+
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '[us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented by two spaces a level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((depth, name.strip(), int(cumulative)))
+    return imports
+
+
+def import_core() -> List[Tuple[int, str, int]]:
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import core'],
+        capture_output=True, text=True, check=True)
+    return parse_importtime(result.stderr)
+
+
+def create_app() -> float:
+    result = subprocess.run([sys.executable, '-c', CREATE_APP],
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.split()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark importing core and create_app()')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10,
+                        help='heaviest imports of core to list')
+    args = parser.parse_args()
+
+    samples = []
+    imports = []
+    for _ in range(args.repeat):
+        imports = import_core()
+        samples += [us / 1000 for depth, name, us in imports
+                    if depth == 0 and name == 'core']
+    report('import core, cumulative', samples)
+    report('create_app()', [create_app() for _ in range(args.repeat)])
+
+    print('heaviest imports of core in the last run:')
+    children = [(name, us) for depth, name, us in imports if depth == 1]
+    for name, us in sorted(children, key=lambda i: -i[1])[:args.top]:
+        print(f'  {name:<42} {us / 1000:9.2f} ms')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+# Token generation against the secrets.choice per symbol
+# implementation the panel used before.
+#
+#   python -m scripts.bench_keygen [--repeat 20]
+
+import argparse
+from secrets import choice
+
+from storage.keygen import TokenGenerator, CHARS, HEX, KEY_ID_LENGTH, \
+    CHANNEL_ID_LENGTH
+
+from .bench import timed, report
+
+BATCH = 500
+
+
+def legacy_string(chars: str, k: int) -> str:
+    return "".join(choice(chars) for _ in range(k))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark token generation')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    generators = {'legacy secrets.choice': legacy_string,
+                  'urandom, no pool': TokenGenerator(0).get_string,
+                  'urandom, 4096 byte pool':
+                      TokenGenerator(4096).get_string}
+
+    for name, chars, k in (('key', CHARS, KEY_ID_LENGTH),
+                           ('channel id', HEX, CHANNEL_ID_LENGTH)):
+        for generator_name, generate in generators.items():
+            report(f'{BATCH} x {name}, {generator_name}',
+                   timed(lambda: [generate(chars, k)
+                                  for _ in range(BATCH)], args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+# Per-request rate limit overhead. Before: one limiter call per limit
+# type, as with the two stacked limiters the panel used. After: both
+# limits in one script call. Round trips only show up against
+# a real server, fakeredis runs in process.
+#
+#   python -m scripts.bench_limits [--redis-url redis://localhost/15]
+
+import argparse
+
+import fakeredis
+from redis import Redis
+
+from content_limits import CombinedLimiter, RouteLimit, Storages, \
+    Strategies
+
+from .bench import timed, report
+
+REQUESTS = 2000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark rate limit overhead per request')
+    parser.add_argument('--redis-url',
+                        help='Redis to use instead of fakeredis, '
+                             'LIMITS/* keys are written there')
+    args = parser.parse_args()
+
+    rds = Redis.from_url(args.redis_url) if args.redis_url \
+        else fakeredis.FakeRedis()
+    limiter = CombinedLimiter(rds)
+    blocking = CombinedLimiter(rds, local_size=1024)
+
+    for strategy in Strategies.all:
+        limit = RouteLimit(count=10 ** 9, strategy=strategy, window=60,
+                           storage=Storages.redis)
+        keys = [f'LIMITS/{strategy}/ip/bench',
+                f'LIMITS/{strategy}/user/bench']
+
+        report(f'{strategy}, call per limit', timed(
+            lambda: all(limiter.hit([key], limit) for key in keys),
+            REQUESTS))
+        report(f'{strategy}, one call', timed(
+            lambda: limiter.hit(keys, limit), REQUESTS))
+        rds.delete(*keys)
+
+    # Refused clients are answered by the local tier
+    limit = RouteLimit(count=1, strategy=Strategies.fixed_window,
+                       window=60, storage=Storages.redis)
+    keys = ['LIMITS/fixed-window/ip/refused']
+    blocking.hit(keys, limit)
+    report('refused, call per request', timed(
+        lambda: limiter.hit(keys, limit), REQUESTS))
+    report('refused, local block', timed(
+        lambda: blocking.hit(keys, limit), REQUESTS))
+    rds.delete(*keys)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+# Mixin loop check on synthetic graphs of 10k channels:
+# the per-channel BFS the panel used before against the recursive CTE.
+#
+#   python -m scripts.bench_mixin_loop [--scratch-url postgresql://...]
+
+import argparse
+import random
+from queue import Queue
+
+from redis_storage import mixin_not_create_loop
+from storage.mixin import Mixin
+
+from .bench import create_session, timed, report
+
+CHANNELS = 10000
+# The old BFS gives up after this many queries
+LEGACY_MAX_QUERIES = 20000
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def legacy_not_create_loop(session, source_id: str, dest_id: str) -> bool:
+    """ BFS without a visited set, one query per channel """
+
+    queue = Queue()
+    queue.put(dest_id)
+    queries = 0
+    while not queue.empty():
+        next_id = queue.get()
+        if next_id == source_id:
+            return False
+
+        queries += 1
+        if queries > LEGACY_MAX_QUERIES:
+            raise QueryBudgetExceeded()
+        for mixin in session.query(Mixin).filter(
+                Mixin.source_channel == next_id).all():
+            queue.put(mixin.dest_channel)
+    return True
+
+
+def chain() -> list:
+    return [(f'c{i}', f'c{i + 1}') for i in range(CHANNELS - 1)]
+
+
+def random_tree() -> list:
+    rnd = random.Random(1)
+    return [(f'c{rnd.randrange(i)}', f'c{i}') for i in range(1, CHANNELS)]
+
+
+def diamonds() -> list:
+    """ Few channels, but 2 ** layers paths """
+
+    pairs = []
+    for i in range(CHANNELS // 3):
+        pairs += [(f'c{i}', f'a{i}'), (f'c{i}', f'b{i}'),
+                  (f'a{i}', f'c{i + 1}'), (f'b{i}', f'c{i + 1}')]
+    return pairs[:CHANNELS]
+
+
+GRAPHS = {'chain': chain, 'random tree': random_tree,
+          'diamonds': diamonds}
+
+
+def fill(session, pairs: list):
+    session.query(Mixin).delete()
+    session.bulk_insert_mappings(Mixin, [
+        dict(source_channel=source, dest_channel=dest, linked_by=str(i))
+        for i, (source, dest) in enumerate(pairs)])
+    session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the mixin loop check')
+    parser.add_argument('--scratch-url',
+                        help='database to use instead of SQLite, '
+                             'its tables are dropped')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    session = create_session(args.scratch_url)
+    for name, graph in GRAPHS.items():
+        fill(session, graph())
+        # No loop: the whole graph is walked
+        for check, func in (('cte', mixin_not_create_loop),
+                            ('legacy bfs', legacy_not_create_loop)):
+            try:
+                samples = timed(lambda: func(session, 'x', 'c0'),
+                                args.repeat if check == 'cte' else 1)
+            except QueryBudgetExceeded:
+                print(f'{name + ", " + check:<44} gave up after '
+                      f'{LEGACY_MAX_QUERIES} queries')
+                continue
+            report(f'{name}, {check}', samples)
+
+
+if __name__ == "__main__":
+    main()
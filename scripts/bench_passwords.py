@@ -0,0 +1,78 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+# Latency of cheap read requests while logins hash passwords, with
+# hashes computed inline in the greenlet and in storage.passwords'
+# thread pool. Reads stand in for polling endpoints: a short I/O wait.
+#
+#   python -m scripts.bench_passwords [--seconds 5] [--logins 20]
+
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse
+from time import perf_counter
+
+import gevent
+from werkzeug.security import generate_password_hash, \
+    check_password_hash
+
+from storage import passwords
+
+from .bench import report
+
+READERS = 50
+# Seconds a read waits for Postgres or Redis
+READ_IO = 0.002
+
+
+def read_loop(samples: list, until: float):
+    while perf_counter() < until:
+        started = perf_counter()
+        gevent.sleep(READ_IO)
+        samples.append((perf_counter() - started) * 1000)
+
+
+def login_loop(check, hashed: str, until: float):
+    while perf_counter() < until:
+        check(hashed, 'secret')
+        # Even inline hashing yields between logins
+        gevent.sleep(0)
+
+
+def storm(check, logins: int, seconds: float) -> list:
+    hashed = generate_password_hash('secret', passwords.HASH_METHOD)
+    until = perf_counter() + seconds
+    samples = []
+    greenlets = [gevent.spawn(read_loop, samples, until)
+                 for _ in range(READERS)]
+    if check is not None:
+        greenlets += [gevent.spawn(login_loop, check, hashed, until)
+                      for _ in range(logins)]
+    gevent.joinall(greenlets)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark reads during a login storm')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--logins', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f'{passwords.HASH_METHOD}, {passwords.HASH_WORKERS} '
+          f'hash threads, {READERS} readers, {args.logins} logins')
+    for name, check in (('no logins', None),
+                        ('inline hashing', check_password_hash),
+                        ('thread pool', passwords.check_password)):
+        report(f'reads, {name}', storm(check, args.logins, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
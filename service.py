@@ -5,58 +5,106 @@
 #  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
 #  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
 
+import argparse
 import logging
+import random
+from os import getenv, path
+from time import monotonic, sleep
 
 import sqlalchemy
 
-from storage.db_session import base_init
-from storage.user_type import UserType
+from storage.db_session import base_init, create_schema, get_engine
+from storage.migrations import create_indexes, widen_columns
+from storage.outbox import push_many, OutboxEntities
+from storage.tiers import load_user_types, upsert_user_types, \
+    clamp_channels
+from storage.url_creator import get_int_env
+from storage.user_type_cache import UserTypeCache
+from redis_storage import migrate_mixins
+from redis_storage.redis_session import base_init as redis_base_init
 
 FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
-logging.basicConfig(format=FORMAT)
-
-# TODO in json or something else
-USER_TYPES = [
-    UserType(
-        name='Free',
-        max_channel_count=2,
-        max_message_size=256,
-        bufferization=True,
-        max_bufferred_message_count=256,
-        buffered_data_persistency=12,
-        end_to_end_data_encryption=False
-    )
-]
+logging.basicConfig(format=FORMAT, level=logging.INFO)
 
+USER_TYPES_CONFIG = getenv('user_types_config') or \
+    path.join(path.dirname(path.abspath(__file__)), 'user_types.json')
+
+# Seconds to wait for the DB before giving up
+DB_WAIT_DEADLINE = get_int_env('db_wait_deadline', 120)
+# Reconnect delays in seconds, doubled up to the max, with jitter
+RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 10
+
+
+def wait_for_db(deadline: int = DB_WAIT_DEADLINE):
+    """ Creates tables, reconnecting until deadline seconds pass """
+    give_up_at = monotonic() + deadline
+    delay = RECONNECT_DELAY
 
-# init data in tables
-def init_db_data():
     while True:
         try:
-            sess_object = base_init()
+            create_schema()
             break
-        except sqlalchemy.exc.OperationalError:
+        except sqlalchemy.exc.OperationalError as e:
+            error = e
             logging.warning('DB host is down. Reconnect...')
-        except Exception as e:
-            logging.warning('Unknown error on connecting to DB. '
-                            'Reconnect...')
+
+        wait = random.uniform(0, delay)
+        if monotonic() + wait > give_up_at:
+            raise TimeoutError(
+                f'DB is unavailable for {deadline} s') from error
+        sleep(wait)
+        delay = min(delay * 2, MAX_RECONNECT_DELAY)
 
     logging.info('Connected to DB')
 
-    session = sess_object()
-    accounts = session.query(UserType).first()
-    if accounts:
-        logging.info('DB has already been initialized')
-        return
-    logging.info('Insert data in DB')
-    for user_type in USER_TYPES:
-        session.add(user_type)
-    session.commit()
-    logging.info('DB init done')
+
+# init data in tables
+def init_db_data(clamp: bool = False):
+    """
+    Applies user_types.json. With clamp, channels exceeding
+    a changed tier are clamped, their old settings are logged
+    and their Redis hashes are rewritten by the outbox worker.
+    """
+
+    session_maker = base_init()
+    session = session_maker()
+    try:
+        upsert_user_types(session, load_user_types(USER_TYPES_CONFIG))
+        clamped = clamp_channels(session) if clamp else []
+        for channel in clamped:
+            logging.info(f'Clamped channel {channel.id}, '
+                         f'it had {dict(channel._mapping)}')
+        push_many(session, OutboxEntities.channel,
+                  [channel.id for channel in clamped])
+        session.commit()
+    finally:
+        session.close()
+
+    # Running panel workers pick up changed tiers
+    UserTypeCache(session_maker, redis_base_init()).invalidate()
+
+    logging.info('User types are up to date')
+    if clamp:
+        logging.info(f'{len(clamped)} channels clamped')
 
 
 def main():
-    init_db_data()
+    parser = argparse.ArgumentParser(
+        description='Create tables and apply user types')
+    parser.add_argument('--clamp-channels', action='store_true',
+                        help='change channels exceeding their owner\'s '
+                             'tier to fit it, old settings are logged')
+    args = parser.parse_args()
+
+    wait_for_db()
+    widen_columns(get_engine())
+    # The user types upsert needs the unique index on their names
+    create_indexes(get_engine())
+    logging.info('Indexes are up to date')
+    init_db_data(args.clamp_channels)
+    migrated = migrate_mixins(redis_base_init())
+    logging.info(f'Mixin sets filled for {migrated} channels')
 
 
 if __name__ == "__main__":
@@ -28,7 +28,8 @@ class Channel(ModelBase):
 
     owner_id = sqlalchemy.Column(sqlalchemy.String,
                                  sqlalchemy.ForeignKey("users.id"),
-                                 nullable=False)
+                                 nullable=False,
+                                 index=True)
 
     max_message_size = sqlalchemy.Column(sqlalchemy.Integer, default=1)
     need_bufferization = sqlalchemy.Column(sqlalchemy.Boolean,
@@ -5,22 +5,155 @@
 #  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
 #  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
 
+import logging
+from time import perf_counter
+from typing import Callable, List
+
 import sqlalchemy
 import sqlalchemy.ext.declarative as dec
 import sqlalchemy.orm as orm
+from flask import Flask, g
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, \
+    create_async_engine
+from sqlalchemy.pool import QueuePool
 
-from .url_creator import create_url
+from .url_creator import create_url, create_pool_params, \
+    POOL_WAIT_WARNING
 
 ModelBase = dec.declarative_base()
 
-# Frontend Postgresql user (check init.sql)
-url = create_url()
-engine = sqlalchemy.create_engine(url, pool_size=20, pool_recycle=3600)
+# Tries to insert a row with a freshly generated random primary key
+ID_ATTEMPTS = 3
 
 
-def base_init():
-    # Base init
-    ModelBase.metadata.create_all(engine)
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool which logs how long a checkout waited for a connection.
+    """
+
+    def _do_get(self):
+        start = perf_counter()
+        connection = super()._do_get()
+        wait = (perf_counter() - start) * 1000
+
+        if wait >= POOL_WAIT_WARNING:
+            logging.warning(f'DB pool checkout waited {wait:.1f} ms '
+                            f'({self.status()})')
+        else:
+            logging.debug(f'DB pool checkout waited {wait:.1f} ms')
+        return connection
+
+
+# Created on first use, see get_engine()
+engine: Engine or None = None
+
+
+def get_engine() -> Engine:
+    global engine
+    if engine is None:
+        # Frontend Postgresql user (check init.sql)
+        engine = sqlalchemy.create_engine(create_url(),
+                                          poolclass=TimedQueuePool,
+                                          **create_pool_params())
+    return engine
+
+
+# Engine of asgi.py, see get_async_engine()
+async_engine: AsyncEngine or None = None
+
+
+def get_async_engine() -> AsyncEngine:
+    global async_engine
+    if async_engine is None:
+        async_engine = create_async_engine(
+            create_url('postgresql+asyncpg'), **create_pool_params())
+    return async_engine
+
+
+def async_base_init():
+    return orm.sessionmaker(bind=get_async_engine(),
+                            class_=AsyncSession)
+
+
+def create_schema():
+    ModelBase.metadata.create_all(get_engine())
 
-    so = orm.sessionmaker(bind=engine)
+
+def base_init():
+    so = orm.sessionmaker(bind=get_engine())
     return so
+
+
+def add_with_unique_id(session: orm.Session, instance: ModelBase,
+                       field: str, generate: Callable[[], str],
+                       attempts: int = ID_ATTEMPTS) -> ModelBase:
+    """
+    Inserts instance under a savepoint with a generated id,
+    generating a new one if the id is already taken.
+    """
+
+    for attempt in range(attempts):
+        setattr(instance, field, generate())
+        try:
+            with session.begin_nested():
+                session.add(instance)
+            return instance
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
+
+
+def insert_with_unique_ids(session: orm.Session, model: type,
+                           rows: List[dict], field: str,
+                           generate: Callable[[], str],
+                           attempts: int = ID_ATTEMPTS) -> List[dict]:
+    """
+    Bulk INSERT of rows with generated ids under a savepoint,
+    regenerating all ids if any of them is already taken.
+    """
+
+    for attempt in range(attempts):
+        for row in rows:
+            row[field] = generate()
+        try:
+            with session.begin_nested():
+                session.execute(sqlalchemy.insert(model), rows)
+            return rows
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
+
+
+class RequestSession:
+    """
+    Session creator bound to the flask application context.
+    All calls during one request share a session, which is committed
+    (or rolled back on error) and closed on teardown.
+    """
+
+    def __init__(self, session_maker: orm.sessionmaker):
+        self.session_maker = session_maker
+
+    def __call__(self) -> orm.Session:
+        if 'db_session' not in g:
+            g.db_session = self.session_maker()
+        return g.db_session
+
+    def init_app(self, app: Flask):
+        app.teardown_appcontext(self.remove)
+
+    @staticmethod
+    def remove(exception=None):
+        session = g.pop('db_session', None)
+        if session is None:
+            return
+
+        try:
+            if exception is None:
+                session.commit()
+            else:
+                session.rollback()
+        finally:
+            session.close()
@@ -35,7 +35,8 @@ class Key(ModelBase):
 
     chan_id = sqlalchemy.Column(sqlalchemy.String(length=64),
                                 sqlalchemy.ForeignKey(Channel.id),
-                                nullable=False)
+                                nullable=False,
+                                index=True)
 
     perm = sqlalchemy.Column(sqlalchemy.Integer,
                              nullable=False,
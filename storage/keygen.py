@@ -7,10 +7,13 @@
 
 # Token generation stub
 
+import os
 import string
-from secrets import choice
+from threading import Lock
 from typing import Iterable
 
+from .url_creator import get_int_env
+
 USER_ID_LENGTH = 32
 KEY_ID_LENGTH = 32
 CHANNEL_ID_LENGTH = 16
@@ -21,9 +24,63 @@ CHARS = string.ascii_letters + string.digits
 HEX = string.digits + "abcdef"
 INTS = string.digits
 
+# Random bytes read from the OS at once, 0 disables the pool
+TOKEN_POOL_SIZE = get_int_env('token_pool_size', 4096)
+
+
+class TokenGenerator:
+    """
+    Random strings from os.urandom read in batches.
+    Bytes are mapped onto the alphabet by rejection sampling,
+    so every symbol has the same probability.
+    """
+
+    def __init__(self, pool_size: int = TOKEN_POOL_SIZE):
+        self.pool_size = pool_size
+        self.pool = b''
+        self.position = 0
+        self.lock = Lock()
+
+    def reset(self):
+        # A forked child must not reuse the parent's random bytes
+        self.pool = b''
+        self.position = 0
+
+    def get_bytes(self, n: int) -> bytes:
+        if not self.pool_size:
+            return os.urandom(n)
+
+        with self.lock:
+            if self.position + n > len(self.pool):
+                self.pool = os.urandom(max(self.pool_size, n))
+                self.position = 0
+            chunk = self.pool[self.position:self.position + n]
+            self.position += n
+        return chunk
+
+    def get_string(self, chars: str, k: int) -> str:
+        alphabet_size = len(chars)
+        if not 0 < alphabet_size <= 256:
+            raise ValueError('Alphabet must have 1 to 256 symbols')
+        # Bytes above the last whole alphabet multiple are rejected
+        limit = 256 - 256 % alphabet_size
+
+        symbols = []
+        while len(symbols) < k:
+            for byte in self.get_bytes(k - len(symbols)):
+                if byte < limit:
+                    symbols.append(chars[byte % alphabet_size])
+        return ''.join(symbols)
+
+
+token_generator = TokenGenerator()
+os.register_at_fork(after_in_child=token_generator.reset)
+
 
 def get_random_string(chars: Iterable, k: int = 1) -> str:
-    return "".join(choice(chars) for _ in range(k))
+    if not isinstance(chars, str):
+        chars = ''.join(chars)
+    return token_generator.get_string(chars, k)
 
 
 # Token length is 32 A-Za-z0-9 symbols.
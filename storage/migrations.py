@@ -0,0 +1,132 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+# Online migrations for an already created database.
+# create_all() does not touch existing tables, so indexes declared
+# on the models are built here with CREATE INDEX CONCURRENTLY.
+
+import logging
+from typing import List
+
+import sqlalchemy
+from sqlalchemy.engine import Engine
+
+from .db_session import ModelBase
+from .channel import Channel
+from .key import Key
+from .mixin import Mixin
+from .outbox import OutboxEvent
+from .user import User
+from .user_type import UserType
+
+MODELS = (Channel, Key, Mixin, OutboxEvent, User, UserType)
+
+MIXINS_UNIQUE_INDEX = 'ux_mixins_source_dest'
+
+# Rows of mixin pairs stored more than once. They may be linked
+# by different keys, so an operator has to pick the row to keep.
+DUPLICATE_MIXINS = """
+SELECT m.id, m.source_channel, m.dest_channel, m.linked_by FROM mixins m
+WHERE EXISTS (SELECT 1 FROM mixins d
+              WHERE d.source_channel = m.source_channel
+                AND d.dest_channel = m.dest_channel
+                AND d.id <> m.id)
+ORDER BY m.source_channel, m.dest_channel, m.id
+"""
+
+# Varchar columns widened to their model's length. Widening doesn't
+# rewrite the table, but ALTER still takes an ACCESS EXCLUSIVE lock
+WIDEN_COLUMNS = (User.__table__.c.hashed_password,)
+
+COLUMN_LENGTH = """
+SELECT character_maximum_length FROM information_schema.columns
+WHERE table_schema = current_schema()
+  AND table_name = :table AND column_name = :column
+"""
+
+INVALID_INDEXES = """
+SELECT c.relname FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+WHERE NOT i.indisvalid AND c.relname = ANY(:names)
+"""
+
+
+def create_index_ddl(index: sqlalchemy.Index) -> str:
+    columns = ', '.join(column.name for column in index.columns)
+    unique = 'UNIQUE ' if index.unique else ''
+    return f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS " \
+           f"{index.name} ON {index.table.name} ({columns})"
+
+
+def get_indexes() -> List[sqlalchemy.Index]:
+    return [index for model in MODELS
+            for index in ModelBase.metadata.tables[
+                model.__tablename__].indexes]
+
+
+def find_duplicate_mixins(connection) -> list:
+    return connection.execute(sqlalchemy.text(DUPLICATE_MIXINS)).all()
+
+
+def report_duplicate_mixins(duplicates: list):
+    for row in duplicates:
+        logging.error(f'Duplicate mixin {row.source_channel} -> '
+                      f'{row.dest_channel}: id {row.id}, '
+                      f'linked by {row.linked_by}')
+    logging.error(f'{len(duplicates)} mixin rows duplicate a pair, '
+                  f'{MIXINS_UNIQUE_INDEX} is not created. Delete all '
+                  f'but one row of each pair and run service.py again')
+
+
+def create_indexes(engine: Engine):
+    """
+    Builds missing model indexes without locking writes.
+    Indexes left invalid by an interrupted build are rebuilt.
+    The unique mixin pair index waits until duplicates are resolved.
+    """
+
+    indexes = get_indexes()
+
+    # CONCURRENTLY can't run inside a transaction block
+    with engine.connect().execution_options(
+            isolation_level='AUTOCOMMIT') as connection:
+        duplicates = find_duplicate_mixins(connection)
+        if duplicates:
+            report_duplicate_mixins(duplicates)
+            indexes = [index for index in indexes
+                       if index.name != MIXINS_UNIQUE_INDEX]
+
+        invalid = connection.execute(
+            sqlalchemy.text(INVALID_INDEXES),
+            {'names': [index.name for index in indexes]}).scalars()
+        for name in invalid:
+            logging.warning(f'Drop invalid index {name}')
+            connection.execute(sqlalchemy.text(
+                f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+
+        for index in indexes:
+            logging.info(f'Create index {index.name}')
+            connection.execute(sqlalchemy.text(create_index_ddl(index)))
+
+
+def widen_columns(engine: Engine):
+    """ Alters only columns still narrower than the model """
+
+    with engine.begin() as connection:
+        for column in WIDEN_COLUMNS:
+            table = column.table.name
+            length = connection.execute(
+                sqlalchemy.text(COLUMN_LENGTH),
+                {'table': table, 'column': column.name}).scalar()
+            if length is None or length >= column.type.length:
+                continue
+
+            logging.info(f'Widen {table}.{column.name} from {length} '
+                         f'to {column.type.length}')
+            connection.execute(sqlalchemy.text(
+                f'ALTER TABLE {table} ALTER COLUMN {column.name} '
+                f'TYPE VARCHAR({column.type.length})'))
@@ -16,6 +16,11 @@ class Mixin(ModelBase):
     """
 
     __tablename__ = "mixins"
+    __table_args__ = (
+        sqlalchemy.Index('ux_mixins_source_dest',
+                         'source_channel', 'dest_channel',
+                         unique=True),
+    )
 
     id = sqlalchemy.Column(sqlalchemy.Integer,
                            primary_key=True,
@@ -25,7 +30,9 @@ class Mixin(ModelBase):
                                        nullable=False)
 
     dest_channel = sqlalchemy.Column(sqlalchemy.String(length=16),
-                                     nullable=False)
+                                     nullable=False,
+                                     index=True)
 
     linked_by = sqlalchemy.Column(sqlalchemy.String(length=32),
-                                  nullable=False)
+                                  nullable=False,
+                                  index=True)
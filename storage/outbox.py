@@ -0,0 +1,79 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+from datetime import datetime
+from typing import Iterable
+
+import sqlalchemy
+import sqlalchemy.orm as orm
+
+from .db_session import ModelBase
+from .url_creator import get_int_env
+
+# Workers LISTEN here to drain events right after they're committed
+OUTBOX_CHANNEL = 'limq_outbox'
+
+# Events the worker takes per Redis pipeline
+OUTBOX_BATCH_SIZE = get_int_env('outbox_batch_size', 500)
+# Seconds between polls when no notification arrives
+OUTBOX_POLL_INTERVAL = get_int_env('outbox_poll_interval', 1)
+# Seconds between lag and drain rate reports
+OUTBOX_REPORT_INTERVAL = get_int_env('outbox_report_interval', 30)
+# Port of the worker's Prometheus endpoint, 0 disables it
+OUTBOX_METRICS_PORT = get_int_env('outbox_metrics_port', 0)
+
+
+class OutboxEntities:
+    key = 'key'
+    channel = 'channel'
+
+
+class OutboxEvent(ModelBase):
+    """
+    Redis state of a key or a channel has to be rewritten.
+    Inserted in the transaction that changes the entity,
+    so Redis is only told about committed data.
+    """
+
+    __tablename__ = 'redis_outbox'
+
+    # SQLite only autoincrements INTEGER keys, for the tests
+    id = sqlalchemy.Column(sqlalchemy.BigInteger()
+                           .with_variant(sqlalchemy.Integer, 'sqlite'),
+                           primary_key=True,
+                           autoincrement=True)
+
+    entity = sqlalchemy.Column(sqlalchemy.String(length=16),
+                               nullable=False)
+
+    entity_id = sqlalchemy.Column(sqlalchemy.String(length=64),
+                                  nullable=False)
+
+    created = sqlalchemy.Column(sqlalchemy.DateTime,
+                                nullable=False,
+                                default=datetime.now)
+
+
+def notify(session: orm.Session):
+    # Delivered on commit, repeats in one transaction are folded
+    session.execute(sqlalchemy.text("SELECT pg_notify(:channel, '')"),
+                    {'channel': OUTBOX_CHANNEL})
+
+
+def push(session: orm.Session, entity: str, entity_id: str):
+    session.add(OutboxEvent(entity=entity, entity_id=entity_id))
+    notify(session)
+
+
+def push_many(session: orm.Session, entity: str,
+              entity_ids: Iterable[str]):
+    created = datetime.now()
+    rows = [dict(entity=entity, entity_id=entity_id, created=created)
+            for entity_id in entity_ids]
+    if rows:
+        session.execute(sqlalchemy.insert(OutboxEvent), rows)
+        notify(session)
@@ -0,0 +1,72 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+# Password hashing off the event loop.
+# Hashes run in a bounded pool of native threads: hashlib releases
+# the GIL, so other greenlets keep serving while a hash is computed.
+
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable
+
+from werkzeug.security import generate_password_hash, \
+    check_password_hash
+
+from .url_creator import get_int_env
+
+# werkzeug method string, e.g. pbkdf2:sha256:600000 or scrypt:32768:8:1
+HASH_METHOD = os.getenv('password_hash_method') or 'pbkdf2:sha256'
+HASH_WORKERS = get_int_env('password_hash_workers', 4)
+
+executor: Executor or None = None
+
+
+def create_executor() -> Executor:
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            from gevent.threadpool import ThreadPoolExecutor as \
+                GeventThreadPoolExecutor
+            return GeventThreadPoolExecutor(max_workers=HASH_WORKERS)
+    except ImportError:
+        pass
+    return ThreadPoolExecutor(max_workers=HASH_WORKERS)
+
+
+def reset_executor():
+    global executor
+    executor = None
+
+
+# Pool threads don't survive fork
+os.register_at_fork(after_in_child=reset_executor)
+
+
+def run(function: Callable, *args):
+    global executor
+    if executor is None:
+        executor = create_executor()
+    return executor.submit(function, *args).result()
+
+
+def hash_password(password: str) -> str:
+    return run(generate_password_hash, password, HASH_METHOD)
+
+
+def check_password(hashed_password: str, password: str) -> bool:
+    return run(check_password_hash, hashed_password, password)
+
+
+@lru_cache(maxsize=1)
+def get_current_method() -> str:
+    # Full method string with defaults filled in by werkzeug
+    return hash_password('').split('$', 1)[0]
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    return hashed_password.split('$', 1)[0] != get_current_method()
@@ -0,0 +1,76 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+# Account tiers declared in user_types.json
+
+import json
+from typing import List
+
+import sqlalchemy
+import sqlalchemy.orm as orm
+from sqlalchemy.engine import Row
+from sqlalchemy.dialects.postgresql import insert
+
+from .user_type import UserType
+
+# Channels of every user brought within their tier's limits,
+# only channels which exceed them are touched. o is the same
+# channel before the update, so its old settings are returned.
+CLAMP_CHANNELS = """
+UPDATE channels c SET
+    max_message_size = LEAST(c.max_message_size, t.max_message_size),
+    need_bufferization = c.need_bufferization AND t.bufferization,
+    buffered_message_count = LEAST(c.buffered_message_count,
+        CASE WHEN t.bufferization
+            THEN t.max_bufferred_message_count ELSE 0 END),
+    buffered_data_persistency = LEAST(c.buffered_data_persistency,
+        CASE WHEN t.bufferization
+            THEN t.buffered_data_persistency ELSE 0 END),
+    end_to_end_data_encryption =
+        c.end_to_end_data_encryption AND t.end_to_end_data_encryption
+FROM channels o, users u JOIN user_types t ON t.type_id = u.user_type
+WHERE o.id = c.id AND u.id = c.owner_id AND (
+    c.max_message_size > t.max_message_size
+    OR (c.need_bufferization AND NOT t.bufferization)
+    OR c.buffered_message_count > CASE WHEN t.bufferization
+        THEN t.max_bufferred_message_count ELSE 0 END
+    OR c.buffered_data_persistency > CASE WHEN t.bufferization
+        THEN t.buffered_data_persistency ELSE 0 END
+    OR (c.end_to_end_data_encryption
+        AND NOT t.end_to_end_data_encryption))
+RETURNING c.id, o.max_message_size, o.need_bufferization,
+    o.buffered_message_count, o.buffered_data_persistency,
+    o.end_to_end_data_encryption
+"""
+
+
+def load_user_types(path: str) -> List[dict]:
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def upsert_user_types(session: orm.Session, user_types: List[dict]):
+    """
+    Inserts new tiers and updates existing ones by name
+    in one statement. Tiers missing from the list are kept.
+    """
+
+    statement = insert(UserType).values(user_types)
+    statement = statement.on_conflict_do_update(
+        index_elements=[UserType.name],
+        set_={column.name: statement.excluded[column.name]
+              for column in UserType.__table__.columns
+              if column.name not in ('type_id', 'name')})
+    session.execute(statement)
+
+
+def clamp_channels(session: orm.Session) -> List[Row]:
+    """
+    Changes channels to fit their owner's tier.
+    Returns their ids with the settings they had before.
+    """
+    return session.execute(sqlalchemy.text(CLAMP_CHANNELS)).all()
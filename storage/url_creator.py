@@ -6,6 +6,7 @@
 #  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
 
 from os import getenv
+from typing import TypedDict
 
 PSQL_USER = getenv('psql_user') or 'limq_front'
 PSQL_PASSWORD = getenv('psql_password')
@@ -14,6 +15,32 @@ PSQL_PORT = getenv('psql_port') or '5432'
 PSQL_DB = getenv('psql_db') or 'limq'
 
 
-def create_url():
-    return f"postgresql://{PSQL_USER}:{PSQL_PASSWORD}@" \
+class PoolParams(TypedDict):
+    pool_size: int
+    max_overflow: int
+    pool_timeout: int
+    pool_recycle: int
+    pool_pre_ping: bool
+
+
+def get_int_env(name: str, default: int) -> int:
+    value = getenv(name)
+    return int(value) if value and value.isdigit() else default
+
+
+def create_url(driver: str = 'postgresql'):
+    return f"{driver}://{PSQL_USER}:{PSQL_PASSWORD}@" \
            f"{PSQL_ADDRESS}:{PSQL_PORT}/{PSQL_DB}"
+
+
+def create_pool_params() -> PoolParams:
+    return PoolParams(
+        pool_size=get_int_env('psql_pool_size', 20),
+        max_overflow=get_int_env('psql_max_overflow', 10),
+        pool_timeout=get_int_env('psql_pool_timeout', 30),
+        pool_recycle=get_int_env('psql_pool_recycle', 3600),
+        pool_pre_ping=getenv('psql_pool_pre_ping', '1') == '1')
+
+
+# Pool checkouts waiting longer are logged as warnings (ms)
+POOL_WAIT_WARNING = get_int_env('psql_pool_wait_warning', 100)
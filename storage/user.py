@@ -7,12 +7,11 @@
 
 import sqlalchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, \
-    check_password_hash
 
 from .user_type import UserType
 from .db_session import ModelBase
 from .keygen import generate_salt
+from . import passwords
 
 
 class User(ModelBase, UserMixin):
@@ -34,7 +33,7 @@ class User(ModelBase, UserMixin):
                               nullable=True,
                               unique=True)
 
-    hashed_password = sqlalchemy.Column(sqlalchemy.String(length=128),
+    hashed_password = sqlalchemy.Column(sqlalchemy.String(length=256),
                                         nullable=True)
 
     salt = sqlalchemy.Column(sqlalchemy.String(length=8), nullable=True)
@@ -42,8 +41,11 @@ class User(ModelBase, UserMixin):
     def set_password(self, password):
         salt = generate_salt()
         self.salt = salt
-        self.hashed_password = generate_password_hash(password + salt)
+        self.hashed_password = passwords.hash_password(password + salt)
 
     def check_password(self, password):
-        return check_password_hash(self.hashed_password,
-                                   password + self.salt)
+        return passwords.check_password(self.hashed_password,
+                                        password + self.salt)
+
+    def password_needs_rehash(self) -> bool:
+        return passwords.needs_rehash(self.hashed_password)
@@ -20,7 +20,9 @@ class UserType(ModelBase):
     type_id = sqlalchemy.Column(sqlalchemy.Integer,
                                 primary_key=True, autoincrement=True)
 
-    name = sqlalchemy.Column(sqlalchemy.String(length=32))
+    name = sqlalchemy.Column(sqlalchemy.String(length=32),
+                             unique=True,
+                             index=True)
     max_channel_count = sqlalchemy.Column(sqlalchemy.Integer,
                                           nullable=False)
     max_message_size = sqlalchemy.Column(sqlalchemy.Integer,
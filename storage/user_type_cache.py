@@ -0,0 +1,135 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+import logging
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Callable, Any
+
+import sqlalchemy.orm as orm
+from redis import Redis
+from redis.exceptions import RedisError
+
+from .url_creator import get_int_env
+from .user_type import UserType
+
+# Bumped by invalidate(), every worker reloads tiers when it changes
+REDIS_USER_TYPES_VERSION_KEY = 'limq_panel_user_types_version'
+
+# Seconds before tiers are reloaded from DB
+USER_TYPES_TTL = get_int_env('user_types_cache_ttl', 60)
+# Seconds between checks of the tiers version in Redis
+USER_TYPES_CHECK_INTERVAL = get_int_env('user_types_check_interval', 5)
+
+
+class UserTypeCache:
+    """
+    In-process cache of user types (account tiers).
+    All tiers are loaded by one query and kept detached from sessions
+    until ttl expires or invalidate() is called in any process
+    sharing the Redis database.
+    """
+
+    def __init__(self, session_maker: orm.sessionmaker,
+                 rds: Redis or None = None,
+                 ttl: int = USER_TYPES_TTL,
+                 check_interval: int = USER_TYPES_CHECK_INTERVAL):
+        self.session_maker = session_maker
+        self.rds = rds
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.lock = Lock()
+
+        self.user_types: List[UserType] = []
+        self.by_id: Dict[int, UserType] = {}
+        self.by_name: Dict[str, UserType] = {}
+        self.payloads: Dict[str, Any] = {}
+        self.loaded_at = None
+        self.version = None
+        self.checked_at = monotonic()
+
+    def get_version(self) -> bytes or None:
+        if self.rds is None:
+            return None
+        try:
+            return self.rds.get(REDIS_USER_TYPES_VERSION_KEY)
+        except RedisError as e:
+            logging.warning(f'User types version is unavailable: {e}')
+            return self.version
+
+    def version_changed(self) -> bool:
+        if self.rds is None or \
+                monotonic() - self.checked_at < self.check_interval:
+            return False
+        self.checked_at = monotonic()
+        if self.get_version() == self.version:
+            return False
+        # Stays expired for the check under the lock
+        self.loaded_at = None
+        return True
+
+    def expired(self) -> bool:
+        return self.loaded_at is None or \
+            monotonic() - self.loaded_at > self.ttl or \
+            self.version_changed()
+
+    def refresh(self):
+        # Read first, a bump during the load causes one more reload
+        self.version = self.get_version()
+        self.checked_at = monotonic()
+
+        session = self.session_maker()
+        try:
+            user_types = session.query(UserType) \
+                .order_by(UserType.type_id).all()
+        finally:
+            session.close()
+
+        self.user_types = user_types
+        self.by_id = {user_type.type_id: user_type
+                      for user_type in user_types}
+        self.by_name = {user_type.name: user_type
+                        for user_type in user_types}
+        self.payloads = {}
+        self.loaded_at = monotonic()
+
+    def actualize(self):
+        if not self.expired():
+            return
+        with self.lock:
+            if self.expired():
+                self.refresh()
+
+    def invalidate(self):
+        """ Makes every worker reload tiers within check_interval """
+
+        self.loaded_at = None
+        if self.rds is not None:
+            self.rds.incr(REDIS_USER_TYPES_VERSION_KEY)
+
+    def get(self, type_id: int) -> UserType or None:
+        self.actualize()
+        return self.by_id.get(type_id)
+
+    def get_by_name(self, name: str) -> UserType or None:
+        self.actualize()
+        return self.by_name.get(name)
+
+    def all(self) -> List[UserType]:
+        self.actualize()
+        return self.user_types
+
+    def get_payload(self, name: str,
+                    build: Callable[[List[UserType]], Any]) -> Any:
+        """
+        Value built from all tiers, kept until the next reload.
+        """
+
+        self.actualize()
+        if name not in self.payloads:
+            self.payloads[name] = build(self.user_types)
+        return self.payloads[name]
@@ -0,0 +1,63 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+import pytest
+import sqlalchemy
+import sqlalchemy.orm as orm
+from sqlalchemy import event
+
+from storage.db_session import ModelBase
+# Models register their tables on import
+from storage import channel, key, mixin, outbox, user, user_type
+
+
+class StatementCounter:
+    """ Statements sent through an engine, see before_cursor_execute """
+
+    def __init__(self, engine):
+        self.statements = []
+        event.listen(engine, 'before_cursor_execute', self.count)
+
+    def count(self, conn, cursor, statement, parameters, context,
+              executemany):
+        self.statements.append(statement)
+
+    def reset(self):
+        self.statements.clear()
+
+    def __len__(self):
+        return len(self.statements)
+
+
+@pytest.fixture
+def engine():
+    engine = sqlalchemy.create_engine('sqlite://')
+
+    @event.listens_for(engine, 'connect')
+    def add_functions(dbapi_connection, _):
+        # Stands in for Postgres notifications
+        dbapi_connection.create_function('pg_notify', 2, lambda *_: None)
+        # Only one connection drains in the tests
+        dbapi_connection.create_function('pg_try_advisory_xact_lock', 1,
+                                         lambda _: 1)
+
+    ModelBase.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    session = orm.sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def statements(engine) -> StatementCounter:
+    return StatementCounter(engine)
@@ -0,0 +1,146 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+import asyncio
+from datetime import datetime
+
+import fakeredis
+import pytest
+import sqlalchemy
+import sqlalchemy.orm as orm
+from flask import Flask
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from asgi import PanelApplication
+from content_limits import AsyncCombinedLimiter, LimitsConfig
+from handlers import ApiRoutes
+from handlers.channel import get_json_channels
+from storage.db_session import ModelBase
+from storage.key import Key
+from storage.user import User
+from storage.user_type_cache import UserTypeCache
+from tests.test_channel import add_channels
+from tests.test_user_type_cache import add_tier
+
+LIMITS = {'default': {'strategy': 'moving-window', 'window': 60},
+          'routes': {'GetChannels': {'count': 2},
+                     'GetKeys': {'count': 10}}}
+
+
+def create_flask_app() -> Flask:
+    """ Stands in for the panel on routes asgi.py doesn't serve """
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'secret'
+
+    @app.route(ApiRoutes.GetChannels)
+    def do_get_channels():
+        return 'flask'
+
+    @app.route(ApiRoutes.GetKeys)
+    def do_get_keys():
+        return 'flask'
+
+    return app
+
+
+@pytest.fixture
+def application(tmp_path):
+    path = tmp_path / 'panel.db'
+    engine = sqlalchemy.create_engine(f'sqlite:///{path}')
+    ModelBase.metadata.create_all(engine)
+    session_maker = orm.sessionmaker(bind=engine)
+
+    session = session_maker()
+    add_tier(session, 'free', 10)
+    for user_id in ('user', 'other'):
+        user = User(id=user_id, username=user_id, user_type=1)
+        session.add(user)
+        add_channels(session, user, 3)
+    # Postgres fills it in the panel
+    session.query(Key).update({Key.created: datetime.now()})
+    session.commit()
+    session.close()
+
+    yield PanelApplication(
+        create_flask_app(),
+        create_async_engine(f'sqlite+aiosqlite:///{path}'),
+        fakeredis.FakeAsyncRedis(),
+        AsyncCombinedLimiter(fakeredis.FakeAsyncRedis()),
+        LimitsConfig(LIMITS),
+        UserTypeCache(session_maker))
+    engine.dispose()
+
+
+def get(application: PanelApplication, path: str, query: bytes = b'',
+        user_id: str = None) -> (int, bytes):
+    headers = []
+    if user_id:
+        cookie = application.serializer.dumps({'_user_id': user_id})
+        headers.append((b'cookie', f'session={cookie}'.encode()))
+    scope = {'type': 'http', 'method': 'GET', 'path': path,
+             'query_string': query, 'headers': headers,
+             'client': ('127.0.0.1', 1000), 'server': ('panel', 80),
+             'scheme': 'http', 'http_version': '1.1', 'root_path': ''}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        await application(scope, receive, send)
+        await application.engine.dispose()
+
+    asyncio.run(run())
+    return messages[0]['status'], \
+        b''.join(message.get('body', b'') for message in messages[1:])
+
+
+def test_channels_match_flask_handler(application):
+    status, body = get(application, ApiRoutes.GetChannels,
+                       user_id='user')
+
+    session = orm.sessionmaker(
+        bind=sqlalchemy.create_engine(
+            application.engine.url.set(drivername='sqlite')))()
+    expected = get_json_channels(User(id='user'), session)
+    session.close()
+
+    assert status == 200
+    assert application.app.json.loads(body) == \
+        application.app.json.loads(application.app.json.dumps(expected))
+
+
+def test_keys(application):
+    status, body = get(application, ApiRoutes.GetKeys,
+                       b'channel_id=user-2', user_id='user')
+    keys = application.app.json.loads(body)
+    assert status == 200
+    assert sorted(key['key'] for key in keys) == ['user-2-0', 'user-2-1']
+
+    status, _ = get(application, ApiRoutes.GetKeys,
+                    b'channel_id=other-2', user_id='user')
+    assert status == 403
+
+    status, _ = get(application, ApiRoutes.GetKeys, user_id='user')
+    assert status == 422
+
+
+def test_anonymous_and_unknown_users_go_to_flask(application):
+    assert get(application, ApiRoutes.GetChannels) == (200, b'flask')
+    assert get(application, ApiRoutes.GetChannels,
+               user_id='nobody') == (200, b'flask')
+
+
+def test_limited(application):
+    statuses = [get(application, ApiRoutes.GetChannels,
+                    user_id='user')[0] for _ in range(3)]
+    assert statuses == [200, 200, 429]
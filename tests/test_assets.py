@@ -0,0 +1,156 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+import pytest
+from flask import Flask
+
+from handlers import assets as assets_module
+from handlers.assets import CachedAsset, Encodings, IMMUTABLE_CACHE, \
+    REVALIDATE_CACHE, PageCache, asset_response, load_directory, \
+    serve_asset
+
+ASSET = CachedAsset(
+    body=b'plain body',
+    encoded={Encodings.brotli: b'br body', Encodings.gzip: b'gzip body'},
+    etag='0123abcd',
+    mimetype='text/plain',
+    immutable=False)
+
+
+@pytest.fixture
+def client(tmp_path):
+    root = tmp_path / 'static'
+    (root / 'js').mkdir(parents=True)
+    (root / 'js' / 'main.3f2a1b9c.js').write_text('main();')
+    (root / 'index.css').write_text('body {}')
+    (tmp_path / 'secret.txt').write_text('secret')
+    assets = load_directory(str(root))
+
+    app = Flask(__name__, static_folder=None)
+
+    @app.route('/asset')
+    def asset():
+        return asset_response(ASSET)
+
+    @app.route('/static/<path:filename>')
+    def static(filename: str):
+        return serve_asset(assets, filename)
+
+    return app.test_client()
+
+
+@pytest.mark.parametrize('accept, encoding, body', [
+    ('br, gzip', Encodings.brotli, b'br body'),
+    ('gzip', Encodings.gzip, b'gzip body'),
+    ('br;q=0, gzip', Encodings.gzip, b'gzip body'),
+    ('br;q=0, gzip;q=0', None, b'plain body'),
+    ('*;q=0', None, b'plain body'),
+    ('', None, b'plain body'),
+])
+def test_encoding_is_negotiated(client, accept, encoding, body):
+    response = client.get('/asset', headers={'Accept-Encoding': accept})
+
+    assert response.status_code == 200
+    assert response.content_encoding == encoding
+    assert response.get_data() == body
+    assert 'Accept-Encoding' in response.vary
+
+
+def test_etag_differs_per_encoding(client):
+    etags = {client.get('/asset', headers={
+        'Accept-Encoding': accept}).get_etag()[0]
+        for accept in ('br', 'gzip', 'identity')}
+
+    assert etags == {'0123abcd-br', '0123abcd-gzip', '0123abcd'}
+
+
+def test_matching_etag_is_not_modified(client):
+    etag = client.get('/asset', headers={
+        'Accept-Encoding': 'gzip'}).get_etag()[0]
+
+    response = client.get('/asset', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert response.get_etag()[0] == etag
+
+    # Same tag, other encoding
+    response = client.get('/asset', headers={
+        'Accept-Encoding': 'br', 'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 200
+    assert response.get_data() == b'br body'
+
+
+def test_fingerprinted_assets_are_immutable(client):
+    response = client.get('/static/js/main.3f2a1b9c.js')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == IMMUTABLE_CACHE
+
+    response = client.get('/static/index.css')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == REVALIDATE_CACHE
+
+
+@pytest.mark.parametrize('path', [
+    '/static/../secret.txt',
+    '/static/js/../../secret.txt',
+    '/static/%2e%2e/secret.txt',
+    '/static/missing.js',
+])
+def test_outside_paths_are_not_found(client, path):
+    assert client.get(path).status_code == 404
+
+
+@pytest.fixture
+def rendered(monkeypatch):
+    """ Templates rendered by PageCache """
+    rendered = []
+    render_template = assets_module.render_template
+
+    def count_render(template: str) -> str:
+        rendered.append(template)
+        return render_template(template)
+
+    monkeypatch.setattr(assets_module, 'render_template', count_render)
+    return rendered
+
+
+@pytest.fixture
+def page_client(tmp_path, rendered):
+    (tmp_path / 'page.html').write_text('<p>{{ 6 * 7 }}</p>' * 100)
+
+    app = Flask(__name__, static_folder=None,
+                template_folder=str(tmp_path))
+    pages = PageCache()
+
+    @app.route('/page')
+    def page():
+        return pages.serve('page.html')
+
+    return app.test_client()
+
+
+def test_page_is_rendered_once(page_client, rendered):
+    for _ in range(3):
+        response = page_client.get('/page')
+        assert response.status_code == 200
+        assert response.get_data(as_text=True) == '<p>42</p>' * 100
+
+    assert rendered == ['page.html']
+
+
+def test_page_is_revalidated(page_client):
+    response = page_client.get('/page', headers={
+        'Accept-Encoding': 'gzip'})
+    assert response.content_encoding == Encodings.gzip
+    assert response.mimetype == 'text/html'
+    assert response.headers['Cache-Control'] == REVALIDATE_CACHE
+
+    etag = response.get_etag()[0]
+    response = page_client.get('/page', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304
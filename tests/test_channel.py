@@ -0,0 +1,56 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+from handlers.channel import get_json_channel, get_json_channels
+from storage.channel import Channel
+from storage.key import Key
+from storage.user import User
+
+PERMISSIONS = (Key.READ, Key.WRITE, Key.READ | Key.WRITE,
+               Key.READ | Key.PAUSED, Key.WRITE | Key.PAUSED)
+
+
+def add_channels(session, user: User, count: int):
+    for i in range(count):
+        channel_id = f'{user.id}-{i}'
+        session.add(Channel(id=channel_id, name=channel_id,
+                            owner_id=user.id))
+        session.flush()
+        for j in range(i % 4):
+            session.add(Key(key=f'{channel_id}-{j}', chan_id=channel_id,
+                            perm=PERMISSIONS[(i + j) % len(PERMISSIONS)]))
+    session.commit()
+
+
+def test_get_json_channels_matches_per_channel_stats(session):
+    user = User(id='user')
+    session.add(user)
+    add_channels(session, user, 12)
+
+    channels = session.query(Channel).order_by(Channel.id).all()
+    expected = [get_json_channel(channel, session) for channel in channels]
+    listed = sorted(get_json_channels(user, session),
+                    key=lambda channel: channel['channel_id'])
+
+    assert listed == expected
+
+
+def test_get_json_channels_query_count_is_constant(session, statements):
+    counts = []
+    for total in (1, 10, 100):
+        user = User(id=f'user-{total}')
+        session.add(user)
+        add_channels(session, user, total)
+        # Commit expired the user, don't count its reload
+        session.refresh(user)
+
+        statements.reset()
+        assert len(get_json_channels(user, session)) == total
+        counts.append(len(statements))
+
+    assert counts == [1, 1, 1]
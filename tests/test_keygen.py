@@ -0,0 +1,88 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+from collections import Counter
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from storage.channel import Channel
+from storage.db_session import add_with_unique_id, insert_with_unique_ids
+from storage.keygen import TokenGenerator, CHARS, HEX, generate_key, \
+    generate_channel_id, KEY_ID_LENGTH, CHANNEL_ID_LENGTH
+from storage.user import User
+
+
+@pytest.mark.parametrize('pool_size', [0, 64, 4096])
+def test_strings_use_alphabet(pool_size):
+    generator = TokenGenerator(pool_size)
+    for chars in (CHARS, HEX, 'ab'):
+        token = generator.get_string(chars, 1000)
+        assert len(token) == 1000
+        assert set(token) <= set(chars)
+
+
+def test_symbols_are_uniform():
+    # 62 does not divide 256, a plain modulo would favour 8 symbols
+    counts = Counter(TokenGenerator().get_string(CHARS, 62 * 2000))
+    assert len(counts) == len(CHARS)
+    assert max(counts.values()) < 2300
+    assert min(counts.values()) > 1700
+
+
+def test_token_shapes():
+    key = generate_key()
+    assert len(key) == KEY_ID_LENGTH and key[0].isdigit()
+    assert len(generate_channel_id()) == CHANNEL_ID_LENGTH
+
+
+def test_reset_drops_pool():
+    generator = TokenGenerator(4096)
+    generator.get_bytes(10)
+    generator.reset()
+    assert generator.pool == b'' and generator.position == 0
+
+
+def taken_then(ids: list):
+    ids = iter(ids)
+    return lambda: next(ids)
+
+
+def add_user(session):
+    session.add(User(id='owner'))
+    session.add(Channel(id='taken', name='taken', owner_id='owner'))
+    session.commit()
+
+
+def test_add_retries_taken_id(session):
+    add_user(session)
+    channel = Channel(name='new', owner_id='owner')
+    add_with_unique_id(session, channel, 'id', taken_then(['taken', 'free']))
+    session.commit()
+
+    assert channel.id == 'free'
+    assert session.query(Channel).count() == 2
+
+
+def test_add_gives_up(session):
+    add_user(session)
+    with pytest.raises(IntegrityError):
+        add_with_unique_id(session, Channel(name='new', owner_id='owner'),
+                           'id', lambda: 'taken', attempts=2)
+
+
+def test_insert_retries_taken_ids(session):
+    add_user(session)
+    rows = [dict(name='a', owner_id='owner'),
+            dict(name='b', owner_id='owner')]
+    insert_with_unique_ids(session, Channel, rows, 'id',
+                           taken_then(['x', 'taken', 'y', 'z']))
+    session.commit()
+
+    assert sorted(channel.id for channel in session.query(Channel)) == \
+        ['taken', 'y', 'z']
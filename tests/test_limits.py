@@ -0,0 +1,157 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+import fakeredis
+import pytest
+
+import content_limits
+from content_limits import CombinedLimiter, LimitsConfig, LocalLimiter, \
+    RouteLimit, Storages, Strategies
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(content_limits, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def limiter() -> CombinedLimiter:
+    return CombinedLimiter(fakeredis.FakeRedis())
+
+
+def make_limit(strategy: str, count: int = 3, window: int = 60):
+    return RouteLimit(count=count, strategy=strategy, window=window,
+                      storage=Storages.redis)
+
+
+@pytest.mark.parametrize('strategy', Strategies.all)
+def test_count_is_allowed(limiter, clock, strategy):
+    limit = make_limit(strategy)
+    assert [limiter.hit(['ip', 'user'], limit) for _ in range(4)] == \
+        [True, True, True, False]
+
+
+def test_fixed_window_expires(limiter, clock):
+    limiter.hit(['ip'], make_limit(Strategies.fixed_window, window=10))
+    assert 9000 < limiter.script.registered_client.pttl('ip') <= 10000
+
+
+@pytest.mark.parametrize('strategy', [Strategies.moving_window,
+                                      Strategies.token_bucket])
+def test_window_passes(limiter, clock, strategy):
+    limit = make_limit(strategy, count=2, window=10)
+    assert limiter.hit(['ip'], limit, cost=2)
+    assert not limiter.hit(['ip'], limit)
+
+    clock.now += 10.1
+    assert limiter.hit(['ip'], limit, cost=2)
+
+
+@pytest.mark.parametrize('strategy', Strategies.all)
+def test_refused_hit_is_not_counted(limiter, clock, strategy):
+    limit = make_limit(strategy, count=2)
+    assert limiter.hit(['shared-ip'], limit, cost=2)
+
+    # Refused by the ip limit, the user limit stays untouched
+    assert not limiter.hit(['shared-ip', 'user'], limit)
+    assert limiter.hit(['user'], limit, cost=2)
+
+
+def test_one_script_call_per_hit(limiter, clock):
+    calls = []
+    script = limiter.script
+    limiter.script = lambda **kwargs: calls.append(kwargs) or \
+        script(**kwargs)
+
+    limiter.hit(['ip', 'user'], make_limit(Strategies.fixed_window))
+    assert len(calls) == 1
+
+
+def test_refused_keys_are_blocked_locally(clock):
+    limiter = CombinedLimiter(fakeredis.FakeRedis(), local_size=16)
+    limit = make_limit(Strategies.fixed_window, count=1)
+    assert limiter.hit(['ip', 'user'], limit)
+    assert not limiter.hit(['ip', 'user'], limit)
+
+    limiter.script = None
+    assert not limiter.hit(['ip', 'other-user'], limit)
+
+
+def test_refused_batch_does_not_block_cheaper_hits(clock):
+    limiter = CombinedLimiter(fakeredis.FakeRedis(), local_size=16)
+    limit = make_limit(Strategies.fixed_window, count=100)
+    assert limiter.hit(['ip', 'user'], limit, cost=10)
+    assert not limiter.hit(['ip', 'user'], limit, cost=100)
+
+    # Blocked locally, without Redis
+    script, limiter.script = limiter.script, None
+    assert not limiter.hit(['ip', 'user'], limit, cost=100)
+
+    limiter.script = script
+    assert limiter.hit(['ip', 'user'], limit)
+
+
+def test_local_limiter():
+    limiter = LocalLimiter(size=1)
+    limit = make_limit(Strategies.fixed_window, count=2)
+    assert limiter.hit(['a'], limit, cost=2)
+    assert not limiter.hit(['a'], limit)
+
+    # Only the most recent client is remembered
+    assert limiter.hit(['b'], limit)
+    assert limiter.hit(['a'], limit, cost=2)
+
+
+def test_tiers_multiply_counts():
+    config = LimitsConfig({
+        'default': {'strategy': 'fixed-window', 'window': 60},
+        'routes': {'Login': {'count': 10},
+                   'Index': {'count': 100, 'storage': 'local'}},
+        'tiers': {'Pro': {'multiplier': 5,
+                          'routes': {'Login': {'window': 30}}}}})
+
+    assert config.get('Login', None).count == 10
+    assert config.get('Login', 'Pro') == RouteLimit(
+        count=50, strategy='fixed-window', window=30, storage='redis')
+    assert config.get('Login', 'Unknown').count == 10
+    assert config.get('Index', 'Pro').storage == Storages.local
+
+
+def test_local_routes_need_fixed_windows():
+    with pytest.raises(ValueError):
+        LimitsConfig({'routes': {'Index': {
+            'count': 1, 'window': 1, 'strategy': 'moving-window',
+            'storage': 'local'}}})
+
+
+def test_moving_window_hits_in_one_ms_are_all_counted(limiter, clock):
+    limit = make_limit(Strategies.moving_window, count=3, window=1)
+    assert limiter.hit(['user'], limit)
+    clock.now = 1000.5
+    assert limiter.hit(['user'], limit)
+
+    # A later request of the same client is refused by the ip limit,
+    # after the script already trimmed the user window
+    limiter.hit(['ip'], limit, cost=3)
+    clock.now = 1001.25
+    assert not limiter.hit(['user', 'ip'], limit)
+
+    # A worker whose clock lags sends the second hit's ms again
+    clock.now = 1000.5
+    assert limiter.hit(['user'], limit)
+    assert limiter.script.registered_client.zcard('user') == 2
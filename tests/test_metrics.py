@@ -0,0 +1,99 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+from collections import Counter, defaultdict
+
+import fakeredis
+import pytest
+import redis
+import sqlalchemy
+from flask import Flask
+
+import metrics
+from handlers import metrics as metrics_handler
+from redis_storage import redis_session
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(metrics_handler.create_handler())
+    return app.test_client()
+
+
+def test_closed_by_default(client, monkeypatch):
+    monkeypatch.setattr(metrics_handler, 'METRICS_TOKEN', None)
+    monkeypatch.setattr(metrics_handler, 'METRICS_PUBLIC', False)
+
+    assert client.get('/metrics').status_code == 404
+
+
+def test_public(client, monkeypatch):
+    monkeypatch.setattr(metrics_handler, 'METRICS_TOKEN', None)
+    monkeypatch.setattr(metrics_handler, 'METRICS_PUBLIC', True)
+
+    assert client.get('/metrics').status_code == 200
+
+
+def test_token(client, monkeypatch):
+    monkeypatch.setattr(metrics_handler, 'METRICS_TOKEN', 'secret')
+    monkeypatch.setattr(metrics_handler, 'METRICS_PUBLIC', True)
+
+    assert client.get('/metrics').status_code == 404
+    assert client.get('/metrics', headers={
+        'Authorization': 'Bearer wrong'}).status_code == 404
+    assert client.get('/metrics', headers={
+        'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_failed_query_timer_popped(engine):
+    metrics.instrument_engines()
+
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(sqlalchemy.exc.OperationalError):
+                conn.execute(sqlalchemy.text('SELECT * FROM missing'))
+        conn.execute(sqlalchemy.text('SELECT 1'))
+
+        assert conn.connection.info['query_started'] == []
+
+
+class FakeCountingConnection(redis_session.CommandCounter,
+                             fakeredis.FakeRedisConnection):
+    ...
+
+
+def test_pool_stats(monkeypatch):
+    monkeypatch.setattr(redis_session, 'pools', {})
+    monkeypatch.setattr(redis_session, 'connection_counts',
+                        defaultdict(Counter))
+
+    pool = redis_session.CountingPool(
+        connection_class=FakeCountingConnection,
+        server=fakeredis.FakeServer(), max_connections=4,
+        host='redis', port=6379, db=0)
+    redis_session.pools['redis://redis:6379/0', None] = pool
+
+    def get_stats():
+        stats, = redis_session.get_pool_stats()
+        return stats['created'], stats['in_use']
+
+    rds = redis.Redis(connection_pool=pool)
+    rds.set('key', 1)
+    assert get_stats() == (1, 0)
+
+    first = pool.get_connection()
+    second = pool.get_connection()
+    assert get_stats() == (2, 2)
+
+    pool.release(first)
+    second.disconnect()
+    assert get_stats() == (1, 1)
+
+    pool.release(second)
+    pool.disconnect()
+    assert get_stats() == (0, 0)
@@ -0,0 +1,77 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+import pytest
+import sqlalchemy
+from sqlalchemy import event
+
+from storage.migrations import find_duplicate_mixins, widen_columns, \
+    MIXINS_UNIQUE_INDEX
+from storage.mixin import Mixin
+
+
+def test_find_duplicate_mixins(engine, session):
+    # Databases created before the index could hold duplicates
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(
+            f'DROP INDEX {MIXINS_UNIQUE_INDEX}'))
+
+    session.add_all([
+        Mixin(source_channel='a', dest_channel='b', linked_by='key-1'),
+        Mixin(source_channel='a', dest_channel='b', linked_by='key-2'),
+        Mixin(source_channel='a', dest_channel='c', linked_by='key-1'),
+        Mixin(source_channel='c', dest_channel='b', linked_by='key-3'),
+    ])
+    session.commit()
+
+    with engine.connect() as connection:
+        duplicates = find_duplicate_mixins(connection)
+
+    assert [(row.source_channel, row.dest_channel, row.linked_by)
+            for row in duplicates] == [('a', 'b', 'key-1'),
+                                       ('a', 'b', 'key-2')]
+    assert session.query(Mixin).count() == 4
+
+
+def set_column_length(engine, length: int):
+    """ Stands in for Postgres' information_schema """
+
+    @event.listens_for(engine, 'connect')
+    def add_schema(dbapi_connection, _):
+        dbapi_connection.create_function('current_schema', 0,
+                                         lambda: 'public')
+
+    engine.dispose()
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(
+            "ATTACH DATABASE ':memory:' AS information_schema"))
+        connection.execute(sqlalchemy.text(
+            'CREATE TABLE information_schema.columns (table_schema, '
+            'table_name, column_name, character_maximum_length)'))
+        connection.execute(sqlalchemy.text(
+            "INSERT INTO information_schema.columns VALUES "
+            "('public', 'users', 'hashed_password', :length)"),
+            {'length': length})
+
+
+def test_wide_columns_are_not_altered(engine, statements):
+    set_column_length(engine, 256)
+    widen_columns(engine)
+
+    assert not [statement for statement in statements.statements
+                if statement.startswith('ALTER')]
+
+
+def test_narrow_columns_are_altered(engine, statements):
+    set_column_length(engine, 128)
+    # SQLite can't change column types, the attempt is enough
+    with pytest.raises(sqlalchemy.exc.OperationalError):
+        widen_columns(engine)
+
+    assert statements.statements[-1] == \
+        'ALTER TABLE users ALTER COLUMN hashed_password TYPE VARCHAR(256)'
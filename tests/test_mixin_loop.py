@@ -0,0 +1,64 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+import pytest
+
+from redis_storage import mixin_not_create_loop
+from storage.mixin import Mixin
+
+
+def add_mixins(session, pairs):
+    for i, (source, dest) in enumerate(pairs):
+        session.add(Mixin(source_channel=source, dest_channel=dest,
+                          linked_by=f'key-{i}'))
+    session.commit()
+
+
+def diamonds(layers: int) -> list:
+    """ Every layer is joined to the next one twice """
+
+    pairs = []
+    for i in range(layers):
+        pairs += [(f'n{i}', f'a{i}'), (f'n{i}', f'b{i}'),
+                  (f'a{i}', f'n{i + 1}'), (f'b{i}', f'n{i + 1}')]
+    return pairs
+
+
+@pytest.mark.parametrize('pairs, source, dest, allowed', [
+    ([], 'a', 'b', True),
+    ([('b', 'c')], 'a', 'b', True),
+    ([('b', 'c'), ('c', 'a')], 'a', 'b', False),
+    ([('b', 'a')], 'a', 'b', False),
+    ([('b', 'c'), ('c', 'b')], 'a', 'b', True),
+])
+def test_loop_check(session, pairs, source, dest, allowed):
+    add_mixins(session, pairs)
+    assert mixin_not_create_loop(session, source, dest) is allowed
+
+
+def test_diamonds_take_one_query(session, statements):
+    # A walk without a visited set would follow 2 ** 40 paths
+    add_mixins(session, diamonds(40))
+
+    statements.reset()
+    assert mixin_not_create_loop(session, 'x', 'n0')
+    assert not mixin_not_create_loop(session, 'n40', 'n0')
+    assert len(statements) == 2
+
+
+def test_10k_channels(session, statements):
+    chain = [(f'c{i}', f'c{i + 1}') for i in range(10000)]
+    add_mixins(session, chain)
+
+    statements.reset()
+    assert not mixin_not_create_loop(session, 'c10000', 'c0',
+                                     max_channels=10000)
+    assert mixin_not_create_loop(session, 'x', 'c0', max_channels=10000)
+    assert not mixin_not_create_loop(session, 'x', 'c0',
+                                     max_channels=9999)
+    assert len(statements) == 3
@@ -0,0 +1,43 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+import fakeredis
+
+import redis_storage
+from redis_storage import migrate_mixins, get_mixins, get_redis_channel, \
+    get_redis_mixins, MIXINS_FIELD
+
+
+def test_migrate_mixins_copies_legacy_fields():
+    rds = fakeredis.FakeRedis()
+    rds.hset(get_redis_channel('a'), MIXINS_FIELD, 'b,c')
+    rds.hset(get_redis_channel('b'), MIXINS_FIELD, '')
+    rds.hset(get_redis_channel('c'), 'name', 'c')
+    rds.sadd(get_redis_mixins('d'), 'a')
+    rds.hset(get_redis_channel('d'), MIXINS_FIELD, 'a,c')
+
+    assert migrate_mixins(rds, batch_size=2) == 2
+    assert sorted(get_mixins(rds, 'a')) == ['b', 'c']
+    assert sorted(get_mixins(rds, 'd')) == ['a', 'c']
+    assert not rds.exists(get_redis_mixins('b'))
+    assert not rds.exists(get_redis_mixins('c'))
+
+    # Repeated runs change nothing
+    assert migrate_mixins(rds) == 2
+    assert sorted(get_mixins(rds, 'a')) == ['b', 'c']
+
+
+def test_deleted_mixin_is_not_migrated_back():
+    rds = fakeredis.FakeRedis()
+    redis_storage.set_mixins(rds, 'a', ['b', 'c'])
+
+    redis_storage.delete_mixin(rds, 'a', 'b')
+    migrate_mixins(rds)
+
+    assert get_mixins(rds, 'a') == ['c']
+    assert rds.hget(get_redis_channel('a'), MIXINS_FIELD) == b'c'
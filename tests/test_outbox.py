@@ -0,0 +1,129 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+import fakeredis
+import pytest
+from redis.client import Pipeline
+from redis.exceptions import ConnectionError
+
+from redis_storage import get_redis_channel, get_redis_key, \
+    get_redis_mixins
+from redis_storage.outbox import drain
+from storage.channel import Channel
+from storage.key import Key
+from storage.mixin import Mixin
+from storage.outbox import notify, push, OutboxEntities, OutboxEvent
+from storage.user import User
+
+
+@pytest.fixture
+def rds():
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture
+def channel(session) -> Channel:
+    session.add(User(id='user'))
+    channel = Channel(id='channel', name='channel', owner_id='user')
+    session.add(channel)
+    session.add(Channel(id='dest', name='dest', owner_id='user'))
+    session.commit()
+    return channel
+
+
+def dump(rds) -> dict:
+    return {key: rds.dump(key) for key in sorted(rds.keys())}
+
+
+def test_notify_executes(session, statements):
+    notify(session)
+
+    assert statements.statements == ["SELECT pg_notify(?, '')"]
+    session.commit()
+
+
+def test_grant_and_toggle_reach_redis(session, rds, channel):
+    session.add(Key(key='key', chan_id=channel.id, perm=Key.READ))
+    push(session, OutboxEntities.key, 'key')
+    session.commit()
+
+    assert drain(session, rds, 100) == 1
+    assert rds.hgetall(get_redis_key('key')) == {
+        b'permissions': str(Key.READ).encode(), b'channel_id': b'channel'}
+
+    session.query(Key).filter(Key.key == 'key') \
+        .update({Key.perm: Key.READ | Key.PAUSED})
+    push(session, OutboxEntities.key, 'key')
+    session.commit()
+
+    assert drain(session, rds, 100) == 1
+    assert rds.hget(get_redis_key('key'), 'permissions') == \
+        str(Key.READ | Key.PAUSED).encode()
+    assert session.query(OutboxEvent).count() == 0
+
+
+def test_deleted_entities_leave_redis(session, rds, channel):
+    session.add(Key(key='key', chan_id=channel.id, perm=Key.READ))
+    session.add(Mixin(source_channel='channel', dest_channel='dest',
+                      linked_by='key'))
+    push(session, OutboxEntities.key, 'key')
+    push(session, OutboxEntities.channel, 'channel')
+    session.commit()
+    drain(session, rds, 100)
+    assert rds.exists(get_redis_key('key'), get_redis_channel('channel'),
+                      get_redis_mixins('channel')) == 3
+
+    session.query(Mixin).delete()
+    session.query(Key).delete()
+    session.query(Channel).filter(Channel.id == 'channel').delete()
+    push(session, OutboxEntities.key, 'key')
+    push(session, OutboxEntities.channel, 'channel')
+    session.commit()
+
+    assert drain(session, rds, 100) == 2
+    assert rds.exists(get_redis_key('key'), get_redis_channel('channel'),
+                      get_redis_mixins('channel')) == 0
+
+
+def test_draining_twice_is_idempotent(session, rds, channel):
+    session.add(Key(key='key', chan_id=channel.id, perm=Key.WRITE))
+    session.add(Mixin(source_channel='channel', dest_channel='dest',
+                      linked_by='key'))
+    session.commit()
+
+    states = []
+    for _ in range(2):
+        push(session, OutboxEntities.key, 'key')
+        push(session, OutboxEntities.channel, 'channel')
+        session.commit()
+        assert drain(session, rds, 100) == 2
+        states.append(dump(rds))
+
+    assert states[0] == states[1]
+    assert rds.smembers(get_redis_mixins('channel')) == {b'dest'}
+
+
+def test_failed_exec_keeps_events(session, rds, channel, monkeypatch):
+    session.add(Key(key='key', chan_id=channel.id, perm=Key.READ))
+    push(session, OutboxEntities.key, 'key')
+    session.commit()
+
+    def fail(self, *args, **kwargs):
+        raise ConnectionError('Redis is down')
+
+    with monkeypatch.context() as patched:
+        patched.setattr(Pipeline, 'execute', fail)
+        with pytest.raises(ConnectionError):
+            drain(session, rds, 100)
+    session.rollback()
+
+    assert session.query(OutboxEvent).count() == 1
+    assert not rds.exists(get_redis_key('key'))
+
+    assert drain(session, rds, 100) == 1
+    assert rds.exists(get_redis_key('key'))
@@ -0,0 +1,60 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from storage import passwords
+from storage.user import User
+
+
+@pytest.fixture
+def method(monkeypatch):
+    def set_method(method: str):
+        monkeypatch.setattr(passwords, 'HASH_METHOD', method)
+        passwords.get_current_method.cache_clear()
+
+    yield set_method
+    passwords.get_current_method.cache_clear()
+
+
+def test_hash_and_check(method):
+    method('pbkdf2:sha256:1000')
+    user = User()
+    user.set_password('secret')
+
+    assert user.hashed_password.startswith('pbkdf2:sha256:1000$')
+    assert user.check_password('secret')
+    assert not user.check_password('wrong')
+    assert not user.password_needs_rehash()
+
+
+def test_changed_method_needs_rehash(method):
+    method('pbkdf2:sha256:1000')
+    user = User()
+    user.set_password('secret')
+
+    method('pbkdf2:sha256:2000')
+    assert user.check_password('secret')
+    assert user.password_needs_rehash()
+
+    user.set_password('secret')
+    assert not user.password_needs_rehash()
+
+
+def test_legacy_hash_needs_rehash(method):
+    method('pbkdf2:sha256:1000')
+    hashed = generate_password_hash('secret', 'pbkdf2:sha256:500')
+    assert passwords.check_password(hashed, 'secret')
+    assert passwords.needs_rehash(hashed)
+
+
+def test_hashing_runs_in_pool(method):
+    method('pbkdf2:sha256:1000')
+    passwords.hash_password('secret')
+    assert passwords.executor is not None
@@ -0,0 +1,105 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+import fakeredis
+
+import redis_storage
+from resync import remove_orphans, stream_channels, write_channels, \
+    write_keys, diff_channels, diff_keys, ResyncStats
+from storage.channel import Channel
+from storage.key import Key
+from storage.user import User
+
+
+def fill(session, rds):
+    session.add(User(id='owner'))
+    session.add(Channel(id='c1', name='c1', owner_id='owner'))
+    session.flush()
+    session.add(Key(key='k1', chan_id='c1', perm=Key.READ))
+    session.commit()
+
+    for key in ('k1', 'revoked'):
+        rds.hset(redis_storage.get_redis_key(key), 'permissions', 1)
+    for channel_id in ('c1', 'gone'):
+        rds.hset(redis_storage.get_redis_channel(channel_id), 'id',
+                 channel_id)
+        rds.sadd(redis_storage.get_redis_mixins(channel_id), 'c2')
+    rds.set('limq_panel_user_u1', 'other data')
+
+
+def test_dry_run_keeps_orphans(session):
+    rds = fakeredis.FakeRedis()
+    fill(session, rds)
+
+    remove_orphans(session, rds, dry_run=True, batch_size=1)
+    assert len(rds.keys()) == 7
+
+
+def test_orphans_are_deleted(session):
+    rds = fakeredis.FakeRedis()
+    fill(session, rds)
+
+    remove_orphans(session, rds, dry_run=False, batch_size=1)
+    assert sorted(rds.keys()) == [b'limq_channel_c1', b'limq_isolate_k1',
+                                  b'limq_mixins_c1',
+                                  b'limq_panel_user_u1']
+
+
+def test_write_channels_replaces_hashes(session, monkeypatch):
+    monkeypatch.setattr(redis_storage, 'MIXINS_LEGACY_FIELD', False)
+    rds = fakeredis.FakeRedis()
+    fill(session, rds)
+    rds.hset(redis_storage.get_redis_channel('c1'), mapping={
+        'dropped_column': 1, redis_storage.MIXINS_FIELD: 'c2'})
+
+    batch = list(stream_channels(session, 10))
+    write_channels(rds, batch)
+
+    [(data, _)] = batch
+    assert rds.hgetall(redis_storage.get_redis_channel('c1')) == \
+        {k.encode(): str(v).encode() for k, v in data.items()}
+    assert not rds.exists(redis_storage.get_redis_mixins('c1'))
+
+
+def test_write_keys():
+    rds = fakeredis.FakeRedis()
+    write_keys(rds, [('k1', Key.READ, 'c1'), ('k2', Key.WRITE, 'c1')])
+
+    assert rds.hgetall(redis_storage.get_redis_key('k2')) == {
+        b'permissions': str(Key.WRITE).encode(), b'channel_id': b'c1'}
+
+
+def test_dry_run_counts(session, monkeypatch):
+    monkeypatch.setattr(redis_storage, 'MIXINS_LEGACY_FIELD', False)
+    rds = fakeredis.FakeRedis()
+    session.add(User(id='owner'))
+    for channel_id in ('synced', 'missing', 'stale'):
+        session.add(Channel(id=channel_id, name=channel_id,
+                            owner_id='owner'))
+        session.flush()
+        session.add(Key(key=channel_id, chan_id=channel_id,
+                        perm=Key.READ))
+    session.commit()
+
+    channels = list(stream_channels(session, 10))
+    write_channels(rds, [channel for channel in channels
+                         if channel[0]['id'] != 'missing'])
+    # Left by a run with the legacy mixins field on
+    rds.hset(redis_storage.get_redis_channel('stale'),
+             redis_storage.MIXINS_FIELD, '')
+    write_keys(rds, [('synced', Key.READ, 'synced'),
+                     ('stale', Key.WRITE, 'stale')])
+
+    stats = ResyncStats('Channels')
+    diff_channels(rds, channels, stats)
+    assert (stats.missing, stats.changed) == (1, 1)
+
+    stats = ResyncStats('Keys')
+    diff_keys(rds, [(key.key, key.perm, key.chan_id)
+                    for key in session.query(Key)], stats)
+    assert (stats.missing, stats.changed) == (1, 1)
@@ -0,0 +1,48 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+import fakeredis
+
+from redis_storage.user_cache import UserCache, get_redis_user
+from storage.user import User
+
+
+def make_user(username: str) -> User:
+    return User(id='user', username=username, email='user@limq.dev',
+                user_type=1)
+
+
+def test_user_is_loaded_once():
+    rds = fakeredis.FakeRedis()
+    loads = []
+
+    def load(user_id):
+        loads.append(user_id)
+        return make_user('name')
+
+    UserCache(rds).get('user', load)
+    assert UserCache(rds).get('user', load).username == 'name'
+    assert loads == ['user']
+
+
+def test_load_racing_update_is_not_cached():
+    rds = fakeredis.FakeRedis()
+    cache = UserCache(rds, local_ttl=0)
+
+    def stale_load(user_id):
+        # Another request commits a rename and invalidates
+        # after this row was read
+        UserCache(rds).invalidate(user_id)
+        return make_user('old')
+
+    assert cache.get('user', stale_load).username == 'old'
+    assert not rds.exists(get_redis_user('user'))
+
+    user = cache.get('user', lambda user_id: make_user('new'))
+    assert user.username == 'new'
+    assert rds.hget(get_redis_user('user'), 'username') == b'new'
@@ -0,0 +1,49 @@
+#   _        _   _     _       _                       __  __  ____
+#  | |      (_) | |   | |     (_)                     |  \/  |/ __ \
+#  | |       _  | |_  | |__    _   _   _   _ __ ___   | \  / | |  | |
+#  | |      | | | __| | "_ \  | | | | | | | "_ ` _ \  | |\/| | |  | |
+#  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
+#  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
+
+
+import fakeredis
+import sqlalchemy.orm as orm
+
+from storage.user_type import UserType
+from storage.user_type_cache import UserTypeCache
+
+
+def add_tier(session, name: str, max_channel_count: int):
+    session.add(UserType(name=name, max_channel_count=max_channel_count,
+                         max_message_size=1024, bufferization=False,
+                         max_bufferred_message_count=0,
+                         buffered_data_persistency=0,
+                         end_to_end_data_encryption=False))
+    session.commit()
+
+
+def test_cached_tiers_take_no_queries(engine, session, statements):
+    add_tier(session, 'Free', 3)
+    cache = UserTypeCache(orm.sessionmaker(bind=engine))
+
+    assert cache.get_by_name('Free').max_channel_count == 3
+    statements.reset()
+    assert cache.get_by_name('Free').max_channel_count == 3
+    assert cache.get(cache.get_by_name('Free').type_id) is not None
+    assert len(statements) == 0
+
+
+def test_invalidate_reaches_other_workers(engine, session):
+    add_tier(session, 'Free', 3)
+    rds = fakeredis.FakeRedis()
+    session_maker = orm.sessionmaker(bind=engine)
+    worker = UserTypeCache(session_maker, rds, check_interval=0)
+    assert worker.get_by_name('Free').max_channel_count == 3
+
+    session.query(UserType).update({UserType.max_channel_count: 5})
+    session.commit()
+    assert worker.get_by_name('Free').max_channel_count == 3
+
+    # What service.py does after reseeding
+    UserTypeCache(session_maker, rds).invalidate()
+    assert worker.get_by_name('Free').max_channel_count == 5
@@ -6,15 +6,13 @@
 #  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
 
 import os
+import socket
+from functools import lru_cache
 
 VERSION = 'v1.1.2'
 
 
-if not os.getenv('HOSTNAME'):
-    raise EnvironmentError('Hostname not found')
-
-hostname = os.getenv('HOSTNAME')
-
-version = f"limq-panel/{VERSION}-{hostname}"
-
-
+@lru_cache(maxsize=None)
+def get_version() -> str:
+    hostname = os.getenv('HOSTNAME') or socket.gethostname()
+    return f"limq-panel/{VERSION}-{hostname}"
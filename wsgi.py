@@ -5,7 +5,9 @@
 #  | |____  | | | |_  | | | | | | | |_| | | | | | | | | |  | | |__| |
 #  |______| |_|  \__| |_| |_| |_|  \__,_| |_| |_| |_| |_|  |_|\___\_\
 
-from core import app
+from core import create_app
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run()